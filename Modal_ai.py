@@ -1,10 +1,20 @@
 import modal
+import asyncio
 import json
 import os
+import threading
 from datetime import datetime
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from infer import app, generate_response, QUESTIONS
+from fastapi.responses import Response, StreamingResponse
+from infer import app, Interviewer, parse_summary, QUESTIONS, COMPLETE_MARKER
+from rate_limit import InterviewLimiter, Rejected, client_key, too_many_requests
+from idempotency import SingleFlight, is_cacheable, turn_key
+from interview_store import InterviewStore, DEFAULT_PAGE_SIZE
+from live_updates import Broadcaster, SUBSCRIBER_RETRY_AFTER, response_stream
+from http_cache import etag_matches, make_etag
+from durable import Drainer, atomic_write_json, recover_all, shutdown
+from profiling import add_profiling, profile_secrets
 
 # Create FastAPI app
 web_app = FastAPI()
@@ -16,25 +26,132 @@ web_app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "ETag"],
 )
 
+# On-demand profiler (X-Profile header / /admin/profile), only when PROFILE_TOKEN is set
+# (deploy with PROFILE_SECRET=<secret name> to attach it, see README)
+add_profiling(web_app)
+
+# Admission control for LLM-backed turns (per client + global)
+limiter = InterviewLimiter()
+
+# Duplicate turns (double-clicks, retries) share one execution
+turns = SingleFlight()
+
+# Inputs the single container accepts at once (see fastapi_app)
+MAX_INPUTS = 100
+
+# Interview progress pushed to /events subscribers. Streams are capped (default
+# 40) so open tabs can never take every input slot from interview turns
+broadcaster = Broadcaster()
+
+# In-flight interview requests, drained before the container shuts down
+drainer = Drainer()
+
 # Create volume for storing responses
 volume = modal.Volume.from_name("my-volume", create_if_missing=True)
 
 # Create web image
 web_image = modal.Image.debian_slim().pip_install("fastapi", "uvicorn")
 
-@app.function(image=web_image, volumes={"/data": volume})
+# One container owns responses.json and interviews.db on the volume (volumes are
+# last-writer-wins per file) and serves many requests concurrently instead. This
+# is also what makes /events complete: progress events fan out in-process and
+# the stream sees responses.json changes only from this container. Don't
+# deploy Modal_noai_savingtojson against the same volume at the same time.
+@app.function(image=web_image, volumes={"/data": volume}, concurrency_limit=1, allow_concurrent_inputs=MAX_INPUTS,
+              secrets=profile_secrets())
 @modal.asgi_app()
 def fastapi_app():
     return web_app
 
+# Indexed store of all interviews, opened on first use inside the (single) container.
+# First use can be from a worker thread (persist), so opening is locked
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            os.makedirs("/data", exist_ok=True)
+            _store = InterviewStore()
+    return _store
+
+# Last parsed responses.json, keyed by file mtime, so polls don't re-parse it
+RESPONSE_FILE = "/data/responses.json"
+_responses_cache = {"mtime": None, "data": None, "etag": None}
+
+# Writes run in worker threads; one at a time, so the cache always matches the file
+_write_lock = threading.Lock()
+
+def save_responses(response_file, data):
+    with _write_lock:
+        raw = atomic_write_json(response_file, data)
+        _responses_cache["mtime"] = os.stat(response_file).st_mtime_ns
+        _responses_cache["data"] = data
+        _responses_cache["etag"] = make_etag(raw)
+
+def persist(response_file, data):
+    """responses.json plus the store row. Blocking (fsyncs, SQLite commit): every user
+    and /events stream shares this container's event loop, so call it via asyncio.to_thread"""
+    save_responses(response_file, data)
+    get_store().save(data)
+
+async def commit_volume():
+    """Publish writes to the volume now (e.g. for analytics_export), not only at shutdown"""
+    try:
+        await volume.commit.aio()
+    except Exception as e:
+        print(f"Error committing volume: {str(e)}")
+
+@web_app.on_event("startup")
+async def recover_state():
+    """Repair responses.json if a previous container died mid-write"""
+    recover_all([RESPONSE_FILE])
+
+@web_app.on_event("shutdown")
+async def flush_state():
+    """Let in-flight interview turns finish, then commit their writes to the volume"""
+    await shutdown(drainer, volume)
+
+def load_responses():
+    """Current responses.json, re-read only when its mtime changed. Raises FileNotFoundError."""
+    mtime = os.stat(RESPONSE_FILE).st_mtime_ns
+    if mtime != _responses_cache["mtime"]:
+        with open(RESPONSE_FILE, 'rb') as f:
+            raw = f.read()
+        _responses_cache["data"] = json.loads(raw)
+        _responses_cache["etag"] = make_etag(raw)
+        _responses_cache["mtime"] = mtime
+    return _responses_cache["data"]
+
 @web_app.get("/")
-async def interview(action: str = "start", question_index: int = None, user_response: str = None):
+async def interview(request: Request, response: Response, action: str = "start", question_index: int = None,
+                    user_response: str = None, idempotency_key: str = None):
+    """Handle interview interactions. Requests sent with an Idempotency-Key run
+    once; duplicates share or replay the first result"""
+    explicit_key = request.headers.get("idempotency-key") or idempotency_key
+    # Tracked so a shutting-down container waits for the turn's writes; a keyed
+    # turn is tracked on its own too, as it keeps running if this request is cancelled
+    async with drainer.track():
+        if not explicit_key:
+            return await handle_interview(request, action, question_index, user_response)
+
+        key = turn_key(request, explicit_key)
+        result, replayed = await turns.run(
+            key, lambda: drainer.run(handle_interview(request, action, question_index, user_response)), is_cacheable
+        )
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return result
+
+async def handle_interview(request: Request, action: str, question_index: int, user_response: str):
     """Handle interview interactions"""
     data_dir = "/data"
     os.makedirs(data_dir, exist_ok=True)
-    response_file = "/data/responses.json"
+    response_file = RESPONSE_FILE
     
     try:
         if action == "start":
@@ -43,8 +160,8 @@ async def interview(action: str = "start", question_index: int = None, user_resp
                 "timestamp_started": datetime.now().strftime("%Y%m%d_%H%M%S"),
                 "responses": []
             }
-            with open(response_file, 'w') as f:
-                json.dump(initial_data, f, indent=2)
+            await asyncio.to_thread(persist, response_file, initial_data)
+            broadcaster.publish("progress", {"status": "started", "timestamp_started": initial_data["timestamp_started"]})
             
             return {
                 "question": QUESTIONS[0],
@@ -52,10 +169,11 @@ async def interview(action: str = "start", question_index: int = None, user_resp
             }
         
         elif action == "chat" and question_index is not None and user_response:
-            # Load existing responses
+            # Load existing responses (cached until responses.json changes); copied so the
+            # cache is only replaced by save_responses
             try:
-                with open(response_file, 'r') as f:
-                    data = json.load(f)
+                data = load_responses()
+                data = dict(data, responses=list(data["responses"]))
             except (FileNotFoundError, json.JSONDecodeError):
                 data = {
                     "timestamp_started": datetime.now().strftime("%Y%m%d_%H%M%S"),
@@ -70,35 +188,54 @@ async def interview(action: str = "start", question_index: int = None, user_resp
                 "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S")
             })
             
-            # Save responses
-            with open(response_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            if question_index < len(QUESTIONS) - 1:
+                # Save responses
+                await asyncio.to_thread(persist, response_file, data)
+                return {
+                    "question": QUESTIONS[question_index + 1],
+                    "question_index": question_index + 1
+                }
             
-            # Generate next question
-            if question_index >= len(QUESTIONS) - 1:
-                try:
-                    next_question = generate_response.remote(data["responses"])
-                    
-                    if "INTERVIEW_COMPLETE" in next_question:
-                        return {
-                            "message": "Interview complete! Responses saved.",
-                            "complete": True,
-                            "summary": next_question
-                        }
-                    
-                    return {
-                        "question": next_question,
-                        "question_index": len(data["responses"])
-                    }
-                except Exception as e:
-                    print(f"Error generating response: {str(e)}")
+            # Generate next question. Admission comes first: a shed (429) turn must
+            # leave responses.json untouched, or the client's retry would store it twice
+            try:
+                async with limiter.limit(client_key(request)):
+                    await asyncio.to_thread(persist, response_file, data)
+                    broadcaster.publish("progress", {"status": "generating", "question_index": question_index})
+                    next_question = await Interviewer().generate_response.remote.aio(
+                        data["responses"], session_id=data["timestamp_started"]
+                    )
+                
+                if COMPLETE_MARKER in next_question:
+                    summary_data = parse_summary(next_question)
+                    country = (summary_data or {}).get("destination_country")
+                    if country and country.lower() == "unknown":
+                        country = None
+                    # The store keeps the structured summary alongside the responses
+                    await asyncio.to_thread(
+                        get_store().save, dict(data, summary=summary_data), completed=True, country=country
+                    )
+                    await commit_volume()
+                    broadcaster.publish("progress", {"status": "complete", "summary": summary_data})
+
                     return {
-                        "error": "Failed to generate next question. Please try again."
+                        "message": "Interview complete! Responses saved.",
+                        "complete": True,
+                        "summary": next_question,
+                        "summary_data": summary_data
                     }
-            else:
+                
+                broadcaster.publish("progress", {"status": "waiting", "question": next_question})
                 return {
-                    "question": QUESTIONS[question_index + 1],
-                    "question_index": question_index + 1
+                    "question": next_question,
+                    "question_index": len(data["responses"])
+                }
+            except Rejected as e:
+                return too_many_requests(e)
+            except Exception as e:
+                print(f"Error generating response: {str(e)}")
+                return {
+                    "error": "Failed to generate next question. Please try again."
                 }
         
         return {"error": "Invalid parameters"}
@@ -108,12 +245,22 @@ async def interview(action: str = "start", question_index: int = None, user_resp
         return {"error": "An unexpected error occurred"}
 
 @web_app.get("/check_responses")
-async def check_responses():
-    """Retrieve saved responses"""
+async def check_responses(request: Request):
+    """Retrieve saved responses, plus interview counts from the in-memory summary.
+    Unchanged data is answered with a 304 when the client sends If-None-Match"""
     try:
-        with open("/data/responses.json", 'r') as f:
-            data = json.load(f)
-            return {"status": "success", "data": data}
+        data = load_responses()
+        summary = get_store().get_summary()
+        etag = make_etag(_responses_cache["etag"], summary)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        body = {"status": "success", "data": data, "summary": summary}
+        return Response(
+            content=json.dumps(body),
+            media_type="application/json",
+            headers={"ETag": etag, "Cache-Control": "no-cache"}
+        )
     except FileNotFoundError:
         return {"status": "No responses yet", "data": None}
     except json.JSONDecodeError:
@@ -122,5 +269,43 @@ async def check_responses():
         print(f"Error checking responses: {str(e)}")
         return {"status": "error", "message": "An unexpected error occurred"}
 
+def load_responses_or_none():
+    try:
+        return load_responses()
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+@web_app.get("/events")
+async def events(request: Request):
+    """Server-sent events: new responses as deltas, plus interview progress.
+    Complete only because the app runs in a single container (see fastapi_app)"""
+    if broadcaster.full():
+        return too_many_requests(Rejected("event_streams", SUBSCRIBER_RETRY_AFTER))
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    return StreamingResponse(
+        response_stream(load_responses_or_none, broadcaster, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@web_app.get("/interviews")
+async def interviews(start_date: str = None, end_date: str = None, completed: bool = None,
+                     country: str = None, q: str = None, cursor: int = None, limit: int = DEFAULT_PAGE_SIZE):
+    """Query stored interviews. Dates are YYYYMMDD; pass next_cursor back for the next page"""
+    try:
+        page = get_store().query(
+            started_from=start_date, started_to=end_date, completed=completed,
+            country=country, keyword=q, cursor=cursor, limit=limit
+        )
+        return {"status": "success", **page}
+    except Exception as e:
+        print(f"Error querying interviews: {str(e)}")
+        return {"status": "error", "message": "An unexpected error occurred"}
+
+@web_app.get("/metrics")
+async def metrics():
+    """Queue depth and rejection counters for the interview limiter, plus duplicate-turn counts"""
+    return {**limiter.metrics(), "turns": turns.metrics()}
+
 if __name__ == "__main__":
     modal.serve(app) 
\ No newline at end of file
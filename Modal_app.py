@@ -1,9 +1,18 @@
 import modal
+import asyncio
+import functools
 import json
 import os
 from datetime import datetime
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from rate_limit import InterviewLimiter, Rejected, client_key, too_many_requests
+from idempotency import SingleFlight, is_cacheable, turn_key
+from hedging import Backend, LatencyTracker, LATENCY_BUDGET, hedged_call
+from conversation import ChatTurn, dump_turns, load_turns, messages
+from durable import Drainer, atomic_write_json, recover_all, shutdown
+from profiling import add_profiling, profile_secrets
+from infer import COMPLETE_MARKER
 
 # Create volume and set up image
 volume = modal.Volume.from_name(name="interview-storage", create_if_missing=True)
@@ -21,11 +30,43 @@ web_app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
+# On-demand profiler (X-Profile header / /admin/profile), only when PROFILE_TOKEN is set
+# (deploy with PROFILE_SECRET=<secret name> to attach it, see README)
+add_profiling(web_app)
+
 # Create Modal app
 app = modal.App("interview-app")
 
+# Admission control for LLM-backed turns (per client + global)
+limiter = InterviewLimiter()
+
+# Duplicate turns (double-clicks, retries) share one execution
+turns = SingleFlight()
+
+# In-flight interview requests, drained before the container shuts down
+drainer = Drainer()
+
+# Hard cap on a single OpenAI call; the hedge below usually answers much sooner
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", 20))
+# Deployed app with the local Interviewer model (infer.py) to race against OpenAI;
+# unset means the cascade is OpenAI -> templated follow-up
+FALLBACK_MODEL_APP = os.environ.get("FALLBACK_MODEL_APP")
+
+# Per-backend latency for the fallback cascade, exposed on /metrics
+backend_latency = LatencyTracker()
+
+# Follow-up asked by the templated fallback, in the order fields are collected
+FIELD_QUESTIONS = {
+    "project_description": "Could you tell me a bit more about what you'd like to ship?",
+    "name": "Thanks! Could I get your name?",
+    "email": "What's the best email address to reach you at?",
+    "country": "Which country are you based in?",
+    "timeline": "What timeline are you working with?",
+}
+
 SYSTEM_PROMPT = """You are an AI interviewer helping to gather information about a potential project. 
 Your goal is to collect the following information naturally through conversation:
 - Name
@@ -41,11 +82,71 @@ Guidelines:
 - If information is unclear or incomplete, ask for clarification
 - Once all information is collected, provide a summary"""
 
+# File to store conversation and collected info
+CONVERSATION_FILE = "/data/conversation.json"
+
+# Conversation state as compact records, re-read only when the file changed
+_state_cache = {"mtime": None, "state": None}
+
+def new_state():
+    return {
+        "conversation_history": [],
+        "collected_info": {
+            "project_description": None,
+            "name": None,
+            "email": None,
+            "country": None,
+            "timeline": None
+        }
+    }
+
+def load_state(conversation_file):
+    """Conversation state with ChatTurn records; a fresh state if there is no file yet"""
+    try:
+        mtime = os.stat(conversation_file).st_mtime_ns
+    except FileNotFoundError:
+        return new_state()
+    if mtime != _state_cache["mtime"]:
+        with open(conversation_file, 'r') as f:
+            state = json.load(f)
+        state["conversation_history"] = load_turns(state["conversation_history"])
+        _state_cache["state"] = state
+        _state_cache["mtime"] = mtime
+    # Turns are shared with the cache; the lists are copied so a failed turn leaves it untouched
+    cached = _state_cache["state"]
+    return {
+        "conversation_history": list(cached["conversation_history"]),
+        "collected_info": dict(cached["collected_info"])
+    }
+
+def save_state(conversation_file, state):
+    atomic_write_json(conversation_file, dict(state, conversation_history=dump_turns(state["conversation_history"])))
+    _state_cache["mtime"] = os.stat(conversation_file).st_mtime_ns
+    _state_cache["state"] = state
+
+@web_app.on_event("startup")
+async def recover_state():
+    """Repair conversation.json if a previous container died mid-write"""
+    recover_all([CONVERSATION_FILE])
+
+@web_app.on_event("shutdown")
+async def flush_state():
+    """Let in-flight interview turns finish, then commit their writes to the volume"""
+    await shutdown(drainer, volume)
+
+@functools.lru_cache(maxsize=64)
+def collected_info_context(flags):
+    """Checklist of collected fields; only 2^5 variants so build each once"""
+    context = "\nCurrently collected information:\n"
+    for key, collected in flags:
+        context += f"- {key}: {'✓' if collected else '❌'}\n"
+    return context
+
 @app.function(secrets=[modal.Secret.from_name("openai-secret")])
 def get_llm_response(conversation_history, collected_info):
     from openai import OpenAI
     
-    client = OpenAI()
+    client = OpenAI(timeout=OPENAI_TIMEOUT, max_retries=1)
     
     # Create messages array
     messages = [{"role": "system", "content": SYSTEM_PROMPT}]
@@ -54,9 +155,7 @@ def get_llm_response(conversation_history, collected_info):
     messages.extend(conversation_history)
     
     # Add context about what information we have/need
-    context = "\nCurrently collected information:\n"
-    for key, value in collected_info.items():
-        context += f"- {key}: {'✓' if value else '❌'}\n"
+    context = collected_info_context(tuple((key, bool(value)) for key, value in collected_info.items()))
     messages.append({"role": "system", "content": context})
     
     response = client.chat.completions.create(
@@ -67,52 +166,75 @@ def get_llm_response(conversation_history, collected_info):
     
     return response.choices[0].message.content
 
+async def templated_follow_up(collected_info):
+    """Instant follow-up asking for the first missing field"""
+    for key, question in FIELD_QUESTIONS.items():
+        if not collected_info.get(key):
+            return question
+    return "Thanks, I think I have everything I need! Is there anything else you'd like to add?"
+
+async def local_model_follow_up(conversation_history):
+    """Ask the local Interviewer model, turning chat messages into question/response pairs"""
+    pairs = []
+    for prev, message in zip(conversation_history, conversation_history[1:]):
+        if prev["role"] == "assistant" and message["role"] == "user":
+            pairs.append({"question": prev["content"], "response": message["content"]})
+    interviewer = modal.Cls.from_name(FALLBACK_MODEL_APP, "Interviewer")
+    reply = await interviewer().generate_response.remote.aio(pairs, structured_summary=False)
+    # Generation stops at the marker, so this may be a bare INTERVIEW_COMPLETE; this
+    # app decides completion itself, so let the next backend answer instead
+    if COMPLETE_MARKER in reply:
+        raise RuntimeError("local model ended the interview")
+    return reply
+
+def interview_backends(conversation_history, collected_info):
+    """Cascade: OpenAI first, local model after the budget, template as a last resort"""
+    chat_messages = messages(conversation_history)
+    backends = [Backend("openai", lambda: get_llm_response.remote.aio(chat_messages, collected_info))]
+    if FALLBACK_MODEL_APP:
+        backends.append(Backend("local_model", lambda: local_model_follow_up(conversation_history), LATENCY_BUDGET))
+    backends.append(Backend("template", lambda: templated_follow_up(collected_info), LATENCY_BUDGET * len(backends)))
+    return backends
+
 @web_app.get("/interview")
-async def interview(action: str = "start", question_index: int = None, user_response: str = None):
+async def interview(request: Request, response: Response, action: str = "start", question_index: int = None,
+                    user_response: str = None, idempotency_key: str = None):
+    """Handle interview interactions. Requests sent with an Idempotency-Key run
+    once; duplicates share or replay the first result"""
+    explicit_key = request.headers.get("idempotency-key") or idempotency_key
+    # Tracked so a shutting-down container waits for the turn's writes; a keyed
+    # turn is tracked on its own too, as it keeps running if this request is cancelled
+    async with drainer.track():
+        if not explicit_key:
+            return await handle_interview(request, action, question_index, user_response)
+
+        key = turn_key(request, explicit_key)
+        result, replayed = await turns.run(
+            key, lambda: drainer.run(handle_interview(request, action, question_index, user_response)), is_cacheable
+        )
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return result
+
+async def handle_interview(request: Request, action: str, question_index: int, user_response: str):
     if not os.path.exists("/data"):
         os.makedirs("/data")
 
-    # File to store conversation and collected info
-    conversation_file = "/data/conversation.json"
-    
+    conversation_file = CONVERSATION_FILE
+
     # Initialize or load conversation state
-    if os.path.exists(conversation_file):
-        with open(conversation_file, 'r') as f:
-            state = json.load(f)
-    else:
-        state = {
-            "conversation_history": [],
-            "collected_info": {
-                "project_description": None,
-                "name": None,
-                "email": None,
-                "country": None,
-                "timeline": None
-            }
-        }
+    state = load_state(conversation_file)
 
     if action == "start":
         # Start new conversation
-        state = {
-            "conversation_history": [],
-            "collected_info": {
-                "project_description": None,
-                "name": None,
-                "email": None,
-                "country": None,
-                "timeline": None
-            }
-        }
-        
+        state = new_state()
+
         initial_question = "What can I help you ship?"
-        state["conversation_history"].append({
-            "role": "assistant",
-            "content": initial_question
-        })
-        
-        with open(conversation_file, 'w') as f:
-            json.dump(state, f, indent=2)
-        
+        state["conversation_history"].append(ChatTurn("assistant", initial_question))
+
+        # fsyncs on the volume; keep them off the event loop every request shares
+        await asyncio.to_thread(save_state, conversation_file, state)
+
         return {
             "question": initial_question,
             "question_index": 0
@@ -120,31 +242,30 @@ async def interview(action: str = "start", question_index: int = None, user_resp
     
     elif action == "chat" and user_response:
         # Add user response to history
-        state["conversation_history"].append({
-            "role": "user",
-            "content": user_response
-        })
-        
+        state["conversation_history"].append(ChatTurn("user", user_response))
+
         # For first response, save as project description
         if question_index == 0:
             state["collected_info"]["project_description"] = user_response
         
-        # Get LLM response
-        llm_response = get_llm_response.remote(
-            state["conversation_history"],
-            state["collected_info"]
-        )
+        # Get LLM response (shed with a 429 if this client or the backend is saturated)
+        try:
+            async with limiter.limit(client_key(request)):
+                llm_response, backend = await hedged_call(
+                    interview_backends(state["conversation_history"], state["collected_info"]),
+                    backend_latency
+                )
+        except Rejected as e:
+            return too_many_requests(e)
+        if backend != "openai":
+            print(f"Answered by fallback backend {backend} (question {question_index})")
         
         # Add LLM response to history
-        state["conversation_history"].append({
-            "role": "assistant",
-            "content": llm_response
-        })
-        
+        state["conversation_history"].append(ChatTurn("assistant", llm_response))
+
         # Save updated state
-        with open(conversation_file, 'w') as f:
-            json.dump(state, f, indent=2)
-        
+        await asyncio.to_thread(save_state, conversation_file, state)
+
         # Check if all info is collected
         if all(state["collected_info"].values()):
             return {
@@ -159,7 +280,19 @@ async def interview(action: str = "start", question_index: int = None, user_resp
 
     return {"error": "Invalid parameters"}
 
-@app.function(image=image, volumes={"/data": volume})
+@web_app.get("/metrics")
+async def metrics():
+    """Queue depth and rejection counters for the interview limiter, duplicate-turn counts
+    and per-backend latency"""
+    return {**limiter.metrics(), "turns": turns.metrics(), "backends": backend_latency.stats()}
+
+# One container serves every request concurrently. The limiter's per-client
+# buckets, its admission gate and the single-flight table are in-process
+# state, so they only see (and shed or coalesce) a burst if it all reaches the
+# same container instead of being spread over new ones. It is also the only
+# writer of conversation.json on the volume (last-writer-wins per file).
+@app.function(image=image, volumes={"/data": volume}, concurrency_limit=1, allow_concurrent_inputs=100,
+              secrets=profile_secrets())
 @modal.asgi_app()
 def fastapi_app():
     return web_app
@@ -2,6 +2,8 @@ import modal
 import json
 import os
 from datetime import datetime
+from interview_store import InterviewStore, DEFAULT_PAGE_SIZE
+from durable import atomic_write_json
 
 # Create image with FastAPI installed
 image = modal.Image.debian_slim().pip_install("fastapi")
@@ -16,7 +18,37 @@ QUESTIONS = [
     "Anything else you'd like to add?"
 ]
 
-@app.function(image=image, volumes={"/data": volume})
+# Indexed store of all interviews, opened on first use inside the container.
+# Only the interview function writes it (see interview_store.py); it runs in a
+# single container and commits the volume after every write.
+_store = None
+
+def get_store():
+    global _store
+    if _store is None:
+        os.makedirs("/data", exist_ok=True)
+        _store = InterviewStore()
+    return _store
+
+# Read-only store for the reader functions, kept for the life of their container
+_reader = None
+
+def read_store():
+    """Read-only view of the writer's latest commit. The volume is reloaded with the
+    database closed, and the summary is re-read from the stored counters, not recounted.
+    Raises FileNotFoundError until the first interview has been saved."""
+    global _reader
+    if _reader is None:
+        volume.reload()
+        _reader = InterviewStore(readonly=True)
+    else:
+        _reader.refresh(volume.reload)
+    return _reader
+
+# Last parsed responses.json, keyed by file mtime, so polls don't re-parse it
+_responses_cache = {"mtime": None, "data": None}
+
+@app.function(image=image, volumes={"/data": volume}, concurrency_limit=1)
 @modal.web_endpoint()
 def interview(action: str = "start", question_index: int = None, user_response: str = None):
     # Ensure data directory exists in volume
@@ -32,8 +64,9 @@ def interview(action: str = "start", question_index: int = None, user_response:
             "timestamp_started": datetime.now().strftime("%Y%m%d_%H%M%S"),
             "responses": []
         }
-        with open(response_file, 'w') as f:
-            json.dump(initial_data, f, indent=2)
+        atomic_write_json(response_file, initial_data)
+        get_store().save(initial_data)
+        volume.commit()
             
         return {
             "question": QUESTIONS[0],
@@ -58,11 +91,12 @@ def interview(action: str = "start", question_index: int = None, user_response:
             "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S")
         })
         
-        # Save updated responses
-        with open(response_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        # Save updated responses (write + rename, so readers never see half a file)
+        atomic_write_json(response_file, data)
 
         next_index = question_index + 1
+        get_store().save(data, completed=next_index >= len(QUESTIONS))
+        volume.commit()
         if next_index < len(QUESTIONS):
             return {
                 "question": QUESTIONS[next_index],
@@ -82,12 +116,22 @@ def check_responses():
     response_file = "/data/responses.json"
     
     try:
-        with open(response_file, 'r') as f:
-            data = json.load(f)
-            return {
-                "status": "success",
-                "data": data
-            }
+        # responses.json predates interviews.db in existing deployments; still serve it
+        try:
+            summary = read_store().get_summary()
+        except FileNotFoundError:
+            summary = None
+        # Only re-parse responses.json when it has actually changed
+        mtime = os.stat(response_file).st_mtime_ns
+        if mtime != _responses_cache["mtime"]:
+            with open(response_file, 'r') as f:
+                _responses_cache["data"] = json.load(f)
+            _responses_cache["mtime"] = mtime
+        return {
+            "status": "success",
+            "data": _responses_cache["data"],
+            "summary": summary
+        }
     except FileNotFoundError:
         return {
             "status": "No responses yet",
@@ -99,5 +143,22 @@ def check_responses():
             "data": None
         }
 
+@app.function(image=image, volumes={"/data": volume})
+@modal.web_endpoint()
+def query_interviews(start_date: str = None, end_date: str = None, completed: bool = None,
+                     country: str = None, q: str = None, cursor: int = None, limit: int = DEFAULT_PAGE_SIZE):
+    try:
+        store = read_store()
+    except FileNotFoundError:
+        return {"status": "success", "items": [], "next_cursor": None}
+    page = store.query(
+        started_from=start_date, started_to=end_date, completed=completed,
+        country=country, keyword=q, cursor=cursor, limit=limit
+    )
+    return {
+        "status": "success",
+        **page
+    }
+
 if __name__ == "__main__":
     modal.serve(app) 
\ No newline at end of file
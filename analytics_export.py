@@ -0,0 +1,256 @@
+# analytics_export.py - incremental Parquet export of completed interviews and issued quotes
+#
+# Runs as a scheduled Modal job. Each run picks up where the last checkpoint
+# left off, flattens new records into Arrow tables and writes new Parquet
+# parts into hive-style day partitions:
+#   /analytics/interviews/day=YYYY-MM-DD/part-<checkpoint position>.parquet
+#   /analytics/quotes/day=YYYY-MM-DD/part-<log file>-<byte offset>.parquet
+# Quotes are read from the JSON lines logs the shipping API appends to, one
+# file per API container (/quotes/<day>/<writer>.jsonl), so every file is
+# append-only and byte offsets stay valid.
+# Reporting then reads the columnar dataset instead of nested JSON.
+
+import json
+import os
+from datetime import datetime
+
+import modal
+
+from durable import atomic_write_json
+from quote_engine import calculate_prices, delivery_days_between
+
+ANALYTICS_DIR = "/analytics"
+QUOTES_DIR = "/quotes"
+CHECKPOINT_FILE = f"{ANALYTICS_DIR}/_checkpoint.json"
+EXPORT_BATCH_SIZE = 5000
+
+# Standard price buckets used for the price tier column
+PRICE_TIERS = [(25, "<25"), (50, "25-50"), (100, "50-100"), (float("inf"), "100+")]
+
+app = modal.App("interview-analytics")
+
+image = modal.Image.debian_slim().pip_install("pyarrow")
+
+interview_volume = modal.Volume.from_name("my-volume", create_if_missing=True)
+quotes_volume = modal.Volume.from_name("shipping-quotes", create_if_missing=True)
+analytics_volume = modal.Volume.from_name("interview-analytics", create_if_missing=True)
+
+
+def price_tier(price: float) -> str:
+    for limit, label in PRICE_TIERS:
+        if price < limit:
+            return label
+
+
+def load_checkpoint():
+    try:
+        with open(CHECKPOINT_FILE, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"interviews": {"completed_at": "", "id": 0}, "quotes": {}}
+
+
+def save_checkpoint(checkpoint):
+    # Write-then-rename so a crash never leaves a half-written checkpoint
+    atomic_write_json(CHECKPOINT_FILE, checkpoint)
+
+
+def write_partitions(table_name: str, rows, day_key: str, part_id: str):
+    """Write rows as one Parquet part per day partition.
+
+    part_id is derived from the checkpoint position, so re-running after a
+    crash between writing and checkpointing overwrites the same parts rather
+    than duplicating rows.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    by_day = {}
+    for row in rows:
+        # The day lives in the directory name, not in the file
+        by_day.setdefault(row.pop(day_key), []).append(row)
+
+    for day, day_rows in by_day.items():
+        out_dir = f"{ANALYTICS_DIR}/{table_name}/day={day}"
+        os.makedirs(out_dir, exist_ok=True)
+        table = pa.Table.from_pylist(day_rows)
+        pq.write_table(table, f"{out_dir}/part-{part_id}.parquet", compression="zstd")
+
+
+def flatten_interview(record):
+    summary = record["data"].get("summary") or {}
+    completed_at = datetime.strptime(record["completed_at"], "%Y%m%d_%H%M%S")
+    return {
+        "day": completed_at.strftime("%Y-%m-%d"),
+        "interview_id": record["id"],
+        "started_at": datetime.strptime(record["timestamp_started"], "%Y%m%d_%H%M%S"),
+        "completed_at": completed_at,
+        "country": record["country"],
+        "project_description": record["project_description"],
+        "num_responses": record["num_responses"],
+        "technical_requirements": summary.get("technical_requirements"),
+        "timeline": summary.get("timeline"),
+        "challenges": summary.get("challenges"),
+        "summary": summary.get("summary"),
+    }
+
+
+def flatten_quote(record):
+    issued_at = datetime.strptime(record["issued_at"], "%Y-%m-%dT%H:%M:%S")
+    if "standard_price" in record:
+        # The prices actually quoted
+        standard, express, priority = record["standard_price"], record["express_price"], record["priority_price"]
+    else:
+        # Records logged before prices were, recomputed with today's pricing code
+        standard, express, priority = calculate_prices(
+            record["weight"], record["length"], record["width"], record["height"], record["fragile"]
+        )
+    return {
+        "day": issued_at.strftime("%Y-%m-%d"),
+        "issued_at": issued_at,
+        "product_type": record["product_type"],
+        "weight": record["weight"],
+        "weight_unit": record["weight_unit"],
+        "volume": record["length"] * record["width"] * record["height"],
+        "dimension_unit": record["dimension_unit"],
+        "fragile": record["fragile"],
+        "origin_country": record["origin_country"],
+        "destination_city": record["destination_city"],
+        "destination_country": record["destination_country"],
+        "transport_mode": record["transport_mode"],
+        "delivery_days": delivery_days_between(record["pickup_date"], record["delivery_deadline"], issued_at),
+        "standard_price": standard,
+        "express_price": express,
+        "priority_price": priority,
+        "price_tier": price_tier(standard),
+    }
+
+
+def export_interviews(checkpoint) -> int:
+    from interview_store import InterviewStore
+
+    # Read-only: the interview app owns interviews.db (see interview_store.py)
+    try:
+        store = InterviewStore(readonly=True)
+    except FileNotFoundError:
+        return 0
+    position = checkpoint["interviews"]
+    exported = 0
+    try:
+        while True:
+            records = store.completed_since(position["completed_at"], position["id"], EXPORT_BATCH_SIZE)
+            if not records:
+                return exported
+            first = records[0]
+            write_partitions("interviews", [flatten_interview(r) for r in records], "day",
+                             f"{first['completed_at']}-{first['id']}")
+            exported += len(records)
+            position["completed_at"], position["id"] = records[-1]["completed_at"], records[-1]["id"]
+            save_checkpoint(checkpoint)
+    finally:
+        store.close()
+
+
+def quote_logs():
+    """Relative paths of every quote log: <day>/<writer>.jsonl, plus old flat <day>.jsonl files."""
+    names = []
+    for entry in sorted(os.listdir(QUOTES_DIR)):
+        if entry.endswith(".jsonl"):
+            names.append(entry)
+        elif os.path.isdir(f"{QUOTES_DIR}/{entry}"):
+            names.extend(f"{entry}/{name}" for name in sorted(os.listdir(f"{QUOTES_DIR}/{entry}"))
+                         if name.endswith(".jsonl"))
+    return names
+
+
+def parse_quotes(lines, name):
+    """Flattened rows for the valid lines; bad lines are logged and skipped."""
+    rows = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            rows.append(flatten_quote(json.loads(line)))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Error parsing quote in {name}: {str(e)}")
+    return rows
+
+
+def export_quotes(checkpoint) -> int:
+    """Read each quote log from the byte offset of the last run."""
+    if not os.path.isdir(QUOTES_DIR):
+        return 0
+
+    offsets = checkpoint["quotes"]
+    exported = 0
+    for name in quote_logs():
+        path = f"{QUOTES_DIR}/{name}"
+        offset = offsets.get(name, 0)
+        size = os.path.getsize(path)
+        if size < offset:
+            # Shrunk, so not the file we checkpointed (e.g. an old shared log overwritten)
+            print(f"Quote log {name} is shorter than its checkpoint, re-reading from the start")
+            offset = 0
+        if size <= offset:
+            continue
+
+        with open(path, "rb") as f:
+            f.seek(offset)
+            chunk = f.read()
+        # Only whole lines; a line still being appended is picked up next run
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+        rows = parse_quotes(complete.splitlines(), name)
+        if rows:
+            write_partitions("quotes", rows, "day", f"{name[:-6].replace('/', '-')}-{offset}")
+            exported += len(rows)
+        offsets[name] = offset + len(complete)
+        save_checkpoint(checkpoint)
+    return exported
+
+
+@app.function(
+    image=image,
+    volumes={"/data": interview_volume, QUOTES_DIR: quotes_volume, ANALYTICS_DIR: analytics_volume},
+    schedule=modal.Period(hours=1),
+    timeout=1800
+)
+def export_analytics():
+    """Export everything new since the last checkpoint."""
+    # Pick up writes committed by the API containers since we started
+    interview_volume.reload()
+    quotes_volume.reload()
+
+    os.makedirs(ANALYTICS_DIR, exist_ok=True)
+    checkpoint = load_checkpoint()
+
+    interviews = export_interviews(checkpoint)
+    quotes = export_quotes(checkpoint)
+    analytics_volume.commit()
+
+    print(f"Exported {interviews} interviews and {quotes} quotes")
+    return {"interviews": interviews, "quotes": quotes}
+
+
+@app.function(image=image, volumes={ANALYTICS_DIR: analytics_volume})
+def shipment_report(days: list = None):
+    """Quote counts and average price by shipment type, destination and price tier."""
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(f"{ANALYTICS_DIR}/quotes", format="parquet", partitioning="hive")
+    filter_expr = ds.field("day").isin(days) if days else None
+    table = dataset.to_table(
+        columns=["product_type", "destination_country", "price_tier", "standard_price"],
+        filter=filter_expr
+    )
+
+    report = {}
+    for column in ("product_type", "destination_country", "price_tier"):
+        grouped = table.group_by(column).aggregate([("standard_price", "count"), ("standard_price", "mean")])
+        report[column] = grouped.sort_by([("standard_price_count", "descending")]).to_pylist()
+    return report
+
+
+@app.local_entrypoint()
+def main():
+    print(export_analytics.remote())
+    print(json.dumps(shipment_report.remote(), indent=2, default=str))
@@ -0,0 +1,45 @@
+# bench_cold_start.py - cold start phases of the interview model container
+#
+# Usage: python bench_cold_start.py [model_id] [device_map] [dtype]
+# Run in a fresh process each time so imports are really cold. Prints the
+# time spent importing torch, importing transformers, loading the weights
+# from the local snapshot and running the warm-up generation. dtype defaults
+# to float16 on GPU and float32 on CPU (see infer.load_model).
+
+import sys
+import time
+
+start = time.perf_counter()
+import torch  # noqa: E402
+t_torch = time.perf_counter() - start
+
+start = time.perf_counter()
+import transformers  # noqa: E402,F401
+t_transformers = time.perf_counter() - start
+
+from infer import PromptBuilder, load_model, warm_up  # noqa: E402
+
+
+def main():
+    model_id = sys.argv[1] if len(sys.argv) > 1 else "HuggingFaceTB/SmolLM-135M-Instruct"
+    device_map = sys.argv[2] if len(sys.argv) > 2 else ("auto" if torch.cuda.is_available() else "cpu")
+    dtype = sys.argv[3] if len(sys.argv) > 3 else None
+
+    start = time.perf_counter()
+    tokenizer, model = load_model(model_id, device_map=device_map, dtype=dtype)
+    t_load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    warm_up(model, PromptBuilder(tokenizer))
+    t_warm = time.perf_counter() - start
+
+    print(f"device {device_map}, dtype {model.dtype}")
+    print(f"import torch         {t_torch:7.2f}s")
+    print(f"import transformers  {t_transformers:7.2f}s")
+    print(f"load weights         {t_load:7.2f}s")
+    print(f"warm-up generation   {t_warm:7.2f}s")
+    print(f"total                {t_torch + t_transformers + t_load + t_warm:7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# bench_compression.py - bytes on the wire and latency for quote / health responses
+#
+# Usage: python bench_compression.py [requests]
+# Runs the shipping FastAPI app in-process and compares identity, gzip and
+# brotli responses for a quote, plus the cached health check.
+
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+from modal_shipping_api import web_app
+
+QUOTE = {
+    "contact": {"email": "ops@example.com"},
+    "product": {
+        "name": "Ceramic vases",
+        "type": "homeware",
+        "dimensions": {"length": 40, "width": 30, "height": 30, "unit": "cm"},
+        "weight": {"value": 6.5, "unit": "kg"},
+    },
+    "origin": {"address": "Storgatan 1", "city": "Stockholm", "country": "Sweden", "postal_code": "11122"},
+    "destination": {"address": "Karl Johans gate 5", "city": "Oslo", "country": "Norway", "postal_code": "0154"},
+    "transport_mode": "road",
+    "timeline": {"pickup_date": "2025-05-02", "delivery_deadline": "2025-05-09"},
+    "special_requirements": "Fragile, keep upright",
+}
+
+
+def measure(client, method, url, n, headers, **kwargs):
+    wire_bytes = 0
+    start = time.perf_counter()
+    for _ in range(n):
+        response = client.request(method, url, headers=headers, **kwargs)
+        # num_bytes_downloaded is the encoded size, before decompression
+        wire_bytes = response.num_bytes_downloaded
+    elapsed = (time.perf_counter() - start) / n
+    return response, wire_bytes, elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    client = TestClient(web_app)
+
+    for label, encoding in (("identity", "identity"), ("gzip", "gzip"), ("brotli", "br")):
+        response, size, latency = measure(
+            client, "POST", "/api/shipping/recommend", n, {"Accept-Encoding": encoding}, json=QUOTE
+        )
+        print(f"quote   {label:9s} {size:6d} bytes  {latency * 1e3:6.2f} ms  "
+              f"content-encoding={response.headers.get('content-encoding', '-')}")
+
+    response, size, latency = measure(client, "GET", "/health", n, {})
+    print(f"health            {size:6d} bytes  {latency * 1e3:6.2f} ms  "
+          f"cache-control={response.headers.get('cache-control')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# bench_conversation.py - memory for many in-memory chat sessions: dict turns vs ChatTurn records
+#
+# Usage: python bench_conversation.py [sessions] [turns_per_session]
+# Builds the sessions the way the apps do (from JSON, so strings are not shared
+# by accident), measures retained memory with tracemalloc, and times the
+# conversion to OpenAI messages.
+
+import json
+import sys
+import time
+import tracemalloc
+
+from conversation import load_turns, messages
+
+
+def chat_json(session, turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "assistant", "content": f"Question {i} for session {session}?"})
+        history.append({"role": "user", "content": f"Answer {i} from session {session}."})
+    return json.dumps(history)
+
+
+def retained(build, sessions):
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = [build(i) for i in range(sessions)]
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return kept, size, elapsed
+
+
+def report(label, sessions, size, elapsed, baseline=None):
+    saving = f"  ({1 - size / baseline:5.1%} smaller)" if baseline else ""
+    print(f"{label:24s} {size / 1e6:8.1f} MB  {size / sessions:7.0f} B/session  "
+          f"{elapsed * 1e3:7.1f} ms{saving}")
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+
+    chat = [chat_json(i, turns) for i in range(sessions)]
+    print(f"{sessions} sessions x {turns} turns")
+
+    _, dict_size, elapsed = retained(lambda i: json.loads(chat[i]), sessions)
+    report("chat dicts", sessions, dict_size, elapsed)
+    chat_records, size, elapsed = retained(lambda i: load_turns(json.loads(chat[i])), sessions)
+    report("chat ChatTurn", sessions, size, elapsed, dict_size)
+
+    start = time.perf_counter()
+    converted = [messages(history) for history in chat_records]
+    elapsed = time.perf_counter() - start
+    shared = all(m["content"] is turn.content for m, turn in zip(converted[0], chat_records[0]))
+    print(f"messages() for all sessions: {elapsed * 1e3:.1f} ms, content shared: {shared}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# bench_crash_recovery.py - kill writers mid-write and check what a restarted container finds
+#
+# Usage: python bench_crash_recovery.py [rounds]
+# Each round starts a process that keeps rewriting a responses.json-sized
+# document, SIGKILLs it at a random moment, then inspects the file the way a
+# new container would. The old `json.dump` into the open file is compared with
+# durable.atomic_write_json + recover().
+
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from durable import atomic_write_json, recover
+
+
+def document(version):
+    return {
+        "timestamp_started": "20250501_120000",
+        "version": version,
+        "responses": [
+            {"question": "Anything else you'd like to add?", "response": "x" * 200, "timestamp": "20250501_120000"}
+            for _ in range(2000)
+        ],
+    }
+
+
+def naive_writer(path):
+    version = 0
+    while True:
+        version += 1
+        with open(path, 'w') as f:
+            json.dump(document(version), f, indent=2)
+
+
+def atomic_writer(path):
+    version = 0
+    while True:
+        version += 1
+        atomic_write_json(path, document(version))
+
+
+def parses(path):
+    try:
+        with open(path) as f:
+            json.load(f)
+        return True
+    except (FileNotFoundError, ValueError):
+        return False
+
+
+def run(writer, rounds, directory):
+    path = os.path.join(directory, f"{writer.__name__}.json")
+    outcomes = {}
+    for _ in range(rounds):
+        process = multiprocessing.Process(target=writer, args=(path,))
+        process.start()
+        time.sleep(random.uniform(0.05, 0.3))
+        process.kill()
+        process.join()
+
+        if writer is atomic_writer:
+            outcome = recover(path)
+            if not parses(path):
+                outcome = "corrupt after recovery"
+        else:
+            outcome = "ok" if parses(path) else "torn"
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return outcomes
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with tempfile.TemporaryDirectory() as directory:
+        for writer in (naive_writer, atomic_writer):
+            outcomes = run(writer, rounds, directory)
+            summary = "  ".join(f"{k}: {v}" for k, v in sorted(outcomes.items()))
+            print(f"{writer.__name__:14s} {summary}")
+
+
+if __name__ == "__main__":
+    main()
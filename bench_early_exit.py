@@ -0,0 +1,56 @@
+# bench_early_exit.py - tokens generated per interview turn, with and without early exit
+#
+# Usage: python bench_early_exit.py [model_id] [turns]
+# Runs on CPU with a small instruct model; the interview logic is the same
+# code infer.generate_response runs on the A100. Also counts which stop
+# condition ended each turn (question, sentence, completion marker, length, eos).
+
+import sys
+import time
+from collections import Counter
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from infer import PromptBuilder, generate_follow_up, generate_summary_json
+
+CONVERSATIONS = [
+    [{"question": "What can I help you ship?", "response": "Two pallets of ceramic tiles from Lisbon to Oslo."}],
+    [{"question": "What can I help you ship?", "response": "A vintage motorbike."},
+     {"question": "Anything else you'd like to add?", "response": "It needs to arrive before the show on June 3rd."}],
+    [{"question": "What can I help you ship?", "response": "Lab samples that must stay below 4 degrees."},
+     {"question": "Anything else you'd like to add?", "response": "Weekly shipments starting next month."},
+     {"question": "AI Follow-up", "response": "Biggest worry is customs delays at the border."}],
+]
+
+
+def main():
+    model_id = sys.argv[1] if len(sys.argv) > 1 else "HuggingFaceTB/SmolLM-135M-Instruct"
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    torch.manual_seed(0)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    model = AutoModelForCausalLM.from_pretrained(model_id, torch_dtype=torch.float32)
+    model.eval()
+    builder = PromptBuilder(tokenizer)
+
+    for early_exit in (False, True):
+        tokens = []
+        reasons = Counter()
+        start = time.perf_counter()
+        for i in range(turns):
+            prompt = builder.input_ids(CONVERSATIONS[i % len(CONVERSATIONS)])
+            _, n, reason = generate_follow_up(model, tokenizer, prompt, early_exit=early_exit)
+            tokens.append(n)
+            reasons[reason] += 1
+        elapsed = time.perf_counter() - start
+        stops = "  ".join(f"{reason}={count}" for reason, count in reasons.most_common())
+        print(f"early_exit={early_exit!s:5}  avg tokens/turn={sum(tokens) / len(tokens):6.1f}  "
+              f"avg latency/turn={elapsed / turns:6.2f}s  stops: {stops}")
+
+    summary, n = generate_summary_json(model, tokenizer, CONVERSATIONS[-1])
+    print(f"structured summary ({n} tokens): {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# bench_hedging.py - tail latency of the fallback cascade with injected slow / failing backends
+#
+# Usage: python bench_hedging.py [turns] [budget_seconds]
+# The primary fake mimics a hosted LLM with a long tail (mostly fast, sometimes
+# very slow, occasionally failing); the local and template fakes are steadier.
+# Prints p50/p95/p99 end-to-end for "primary only" versus the hedged cascade,
+# plus how often each backend won. check_cascade() first asserts the cascade's
+# behaviour with deterministic fakes: winner selection, failover, and losers
+# cancelled and recorded.
+
+import asyncio
+import random
+import sys
+import time
+
+from hedging import Backend, LatencyTracker, hedged_call
+
+
+def fake_backend(name, fast, slow, slow_rate, error_rate, rng):
+    async def call():
+        if rng.random() < error_rate:
+            await asyncio.sleep(fast)
+            raise RuntimeError(f"{name} unavailable")
+        await asyncio.sleep(slow if rng.random() < slow_rate else fast)
+        return f"reply from {name}"
+    return call
+
+
+def steady(name, delay, log, error=None):
+    """Deterministic fake that logs how it ended: ok, error or cancelled."""
+    async def call():
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            log[name] = "cancelled"
+            raise
+        if error:
+            log[name] = "error"
+            raise RuntimeError(error)
+        log[name] = "ok"
+        return name
+    return call
+
+
+async def check_cascade():
+    # Primary answers within budget: it wins, the fallback never starts
+    log, tracker = {}, LatencyTracker()
+    result, winner = await hedged_call(
+        [Backend("primary", steady("primary", 0.01, log)), Backend("fallback", steady("fallback", 0.01, log), 0.1)],
+        tracker
+    )
+    assert (result, winner) == ("primary", "primary"), winner
+    assert log == {"primary": "ok"}, log
+    assert tracker.stats()["primary"]["won"] == 1 and "fallback" not in tracker.stats()
+
+    # Primary over budget: the hedge wins, the primary is cancelled and recorded with its run time
+    log, tracker = {}, LatencyTracker()
+    _, winner = await hedged_call(
+        [Backend("primary", steady("primary", 1.0, log)), Backend("fallback", steady("fallback", 0.01, log), 0.05)],
+        tracker
+    )
+    await asyncio.sleep(0)  # let the cancellation land
+    assert winner == "fallback", winner
+    assert log == {"fallback": "ok", "primary": "cancelled"}, log
+    stats = tracker.stats()["primary"]
+    assert stats["lost"] == 1 and stats["won"] == 0, stats
+    assert 0.05 <= stats["p50"] < 0.5, stats
+
+    # Primary fails fast: the fallback starts at once instead of waiting out its delay
+    log, tracker = {}, LatencyTracker()
+    start = time.perf_counter()
+    _, winner = await hedged_call(
+        [Backend("primary", steady("primary", 0.01, log, error="down")),
+         Backend("fallback", steady("fallback", 0.01, log), 1.0)],
+        tracker
+    )
+    assert winner == "fallback" and time.perf_counter() - start < 0.5, winner
+    assert tracker.stats()["primary"]["error"] == 1
+
+    # Everything fails: the last error is raised
+    try:
+        await hedged_call([Backend("primary", steady("primary", 0.0, {}, error="down")),
+                           Backend("fallback", steady("fallback", 0.0, {}, error="also down"), 1.0)])
+    except RuntimeError as e:
+        assert str(e) == "also down", e
+    else:
+        raise AssertionError("hedged_call returned although every backend failed")
+    print("cascade checks passed")
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+    return f"p50 {pick(50) * 1e3:7.1f} ms  p95 {pick(95) * 1e3:7.1f} ms  p99 {pick(99) * 1e3:7.1f} ms"
+
+
+async def run(turns, budget, hedged):
+    rng = random.Random(0)
+    primary = fake_backend("openai", 0.05, 1.0, 0.08, 0.02, rng)
+    local = fake_backend("local_model", 0.12, 0.3, 0.05, 0.0, rng)
+    template = fake_backend("template", 0.0, 0.0, 0.0, 0.0, rng)
+    tracker = LatencyTracker(window=turns)
+    latencies = []
+
+    for _ in range(turns):
+        backends = [Backend("openai", primary)]
+        if hedged:
+            backends += [Backend("local_model", local, budget), Backend("template", template, budget * 2)]
+        start = time.perf_counter()
+        try:
+            await hedged_call(backends, tracker)
+        except RuntimeError:
+            pass
+        latencies.append(time.perf_counter() - start)
+    return latencies, tracker
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 0.15
+    asyncio.run(check_cascade())
+
+    for label, hedged in (("primary only", False), ("hedged", True)):
+        latencies, tracker = asyncio.run(run(turns, budget, hedged))
+        print(f"{label:13s} {percentiles(latencies)}")
+        for name, stats in tracker.stats().items():
+            print(f"  {name:12s} won {stats['won']:4d}  lost {stats['lost']:4d}  error {stats['error']:4d}")
+
+
+if __name__ == "__main__":
+    main()
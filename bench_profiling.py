@@ -0,0 +1,55 @@
+# bench_profiling.py - request overhead of the on-demand profiler
+#
+# Usage: python bench_profiling.py [requests]
+# Times the shipping quote endpoint in-process three ways: profiler not
+# installed (PROFILE_TOKEN unset), installed but not requested, and every
+# request profiled (with and without allocation tracking).
+
+import sys
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import profiling
+from bench_compression import QUOTE
+from modal_shipping_api import web_app_shipping_recommend
+
+TOKEN = "bench"
+
+
+def build_app(install: bool):
+    app = FastAPI()
+    app.post("/api/shipping/recommend")(web_app_shipping_recommend)
+    if install:
+        profiling.PROFILE_TOKEN = TOKEN
+        profiling.add_profiling(app)
+    return app
+
+
+def measure(client, n, headers):
+    start = time.perf_counter()
+    for _ in range(n):
+        client.post("/api/shipping/recommend", json=QUOTE, headers=headers)
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    plain = TestClient(build_app(False))
+    installed = TestClient(build_app(True))
+    measure(plain, 20, {})  # warm up
+
+    baseline = measure(plain, n, {})
+    cases = [
+        ("not installed", baseline),
+        ("installed, idle", measure(installed, n, {})),
+        ("profiled", measure(installed, n, {"X-Profile": TOKEN})),
+        ("profiled + alloc", measure(installed, max(1, n // 10), {"X-Profile": TOKEN, "X-Profile-Alloc": "1"})),
+    ]
+    for label, latency in cases:
+        print(f"{label:18s} {latency * 1e3:7.3f} ms/request  ({latency / baseline - 1:+6.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# bench_prompt_builder.py - tokenization time per turn vs. conversation length
+#
+# Usage: python bench_prompt_builder.py [tokenizer_id] [turns]
+# Compares re-tokenizing the whole prompt every turn with PromptBuilder's
+# cached, incremental token ids, and asserts both give the same ids.
+
+import sys
+import time
+
+from transformers import AutoTokenizer
+
+from infer import PromptBuilder
+
+
+def main():
+    tokenizer_id = sys.argv[1] if len(sys.argv) > 1 else "mistralai/Mistral-7B-Instruct-v0.1"
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_id)
+    builder = PromptBuilder(tokenizer)
+    assert builder.incremental, "incremental ids don't match the chat template for this tokenizer"
+
+    history = []
+    for i in range(turns):
+        history.append({
+            "question": f"Follow-up question number {i} about the shipment?",
+            "response": "The goods are fragile glassware, about 40 kg, leaving from Gothenburg next week.",
+        })
+
+        # Re-render and re-tokenize the whole template, as before PromptBuilder
+        start = time.perf_counter()
+        expected = builder.full_ids(history)
+        full = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ids = builder.input_ids(history, session_id="bench")
+        incremental = time.perf_counter() - start
+        assert ids == expected, f"turn {i + 1}: incremental ids differ from the tokenized template"
+
+        if (i + 1) % max(1, turns // 10) == 0:
+            print(f"turn {i + 1:4d}  full={full * 1e3:7.3f}ms  incremental={incremental * 1e3:7.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
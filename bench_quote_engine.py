@@ -0,0 +1,89 @@
+# bench_quote_engine.py - batch quote throughput vs. worker count
+#
+# Usage: python bench_quote_engine.py [batch_size] [max_workers]
+# Run on an 8-core machine to check scaling of quote_engine.quote_batch.
+# Quotes are logged to a temp dir, as the batch endpoint does. Also prints the
+# parent's serial share (packing inputs, splitting outputs) and the speedup
+# Amdahl's law allows with that share.
+
+import json
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime
+from types import SimpleNamespace
+
+from quote_engine import _pack_batch, _unpack_quotes, quote_batch, quote_from_request, quote_record
+
+
+def make_request(i: int):
+    """Build a ShippingRequest-shaped object without needing pydantic."""
+    return SimpleNamespace(
+        product=SimpleNamespace(
+            name=f"Package {i}",
+            type="electronics" if i % 2 else "clothing",
+            weight=SimpleNamespace(value=1.5 + i % 7, unit="kg"),
+            dimensions=SimpleNamespace(length=30.0, width=20.0 + i % 5, height=10.0, unit="cm"),
+        ),
+        origin=SimpleNamespace(city="Helsinki", country="Finland"),
+        destination=SimpleNamespace(city="Stockholm", country="Sweden"),
+        transport_mode="road",
+        special_requirements="fragile" if i % 3 == 0 else "none",
+        # Mix of ISO and natural language dates to exercise parse_date
+        timeline=SimpleNamespace(
+            pickup_date="2025-04-01" if i % 2 else "tomorrow",
+            delivery_deadline="next week" if i % 2 else "2025-04-20",
+        ),
+    )
+
+
+def serial_share(requests, max_workers):
+    """Time the parent-side work against the quoting itself."""
+    start = time.perf_counter()
+    _pack_batch(requests)
+    pack = time.perf_counter() - start
+
+    # What the workers do: render and build the log records
+    start = time.perf_counter()
+    quotes = [quote_from_request(r) for r in requests]
+    issued_at = datetime.now()
+    [json.dumps(quote_record(r, issued_at)) for r in requests]
+    work = time.perf_counter() - start
+
+    lengths, body = array("q", map(len, quotes)).tobytes(), "".join(quotes)
+    start = time.perf_counter()
+    _unpack_quotes(lengths, body)
+    unpack = time.perf_counter() - start
+
+    share = (pack + unpack) / (pack + unpack + work)
+    cap = 1 / (share + (1 - share) / max_workers)
+    print(f"parent: pack {pack:.3f}s  unpack {unpack:.3f}s  vs quoting {work:.3f}s  "
+          f"serial share {share:.1%}  -> max speedup at {max_workers} workers {cap:.2f}x")
+
+
+def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    requests = [make_request(i) for i in range(batch_size)]
+    serial_share(requests, max_workers)
+    with tempfile.TemporaryDirectory() as quotes_dir:
+
+        baseline = None
+        workers = 1
+        while workers <= max_workers:
+            # Warm the pool so process start-up isn't counted
+            quote_batch(requests[:1000], workers=workers, quotes_dir=quotes_dir)
+
+            start = time.perf_counter()
+            quote_batch(requests, workers=workers, quotes_dir=quotes_dir)
+            elapsed = time.perf_counter() - start
+
+            baseline = baseline or elapsed
+            print(f"workers={workers:2d}  {elapsed:7.3f}s  "
+                  f"{batch_size / elapsed:10.0f} quotes/s  speedup={baseline / elapsed:4.2f}x")
+            workers *= 2
+
+
+if __name__ == "__main__":
+    main()
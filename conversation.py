@@ -0,0 +1,69 @@
+# conversation.py - compact in-memory conversation records
+#
+# Conversations used to live in memory as lists of dicts, one dict per turn.
+# Chat turns (Modal_app) are __slots__ records instead, with the role (one of
+# a handful of strings) interned. The JSON on disk keeps its existing format.
+# Modal_ai's interview responses stay plain dicts: they go straight back into
+# responses.json and the /events deltas, so a record would only be converted
+# back on every write.
+#
+# Records support turn["role"] / dict(turn), so they can be handed to code
+# written for the dict format (infer.format_turn, PromptBuilder) as they are.
+# messages() builds the OpenAI message list from the same string objects
+# without copying the content.
+
+import sys
+
+
+class _Record:
+    """Read-only mapping access to the slots, for code written against dicts."""
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def keys(self):
+        return self.__slots__
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(self[k] == other[k] for k in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={self[k]!r}" for k in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class ChatTurn(_Record):
+    """One chat message (Modal_app): role + content."""
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: str):
+        self.role = sys.intern(role)
+        self.content = content
+
+    @classmethod
+    def from_dict(cls, entry):
+        return cls(entry["role"], entry["content"])
+
+    def to_dict(self):
+        return {"role": self.role, "content": self.content}
+
+
+def messages(turns, system_prompt: str = None):
+    """OpenAI / chat-template messages for these turns. Content strings are shared, not copied."""
+    result = [{"role": "system", "content": system_prompt}] if system_prompt else []
+    result.extend({"role": turn.role, "content": turn.content} for turn in turns)
+    return result
+
+
+def load_turns(entries, record=ChatTurn):
+    return [record.from_dict(entry) for entry in entries]
+
+
+def dump_turns(turns):
+    return [turn.to_dict() for turn in turns]
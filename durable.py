@@ -0,0 +1,241 @@
+# durable.py - crash-safe JSON state files and graceful shutdown for the interview apps
+#
+# atomic_write_json writes to a unique temp file, fsyncs it and renames it over
+# the target, so readers only ever see the old or the new document, never half
+# of one. Next to each file we keep:
+#   <file>.sha256      checksum of the current document
+#   <file>.bak         the previous document (hard link, copied where links fail)
+#   <file>.bak.sha256  its checksum
+# recover() runs at startup: a file that doesn't parse or doesn't match its
+# checksum (crash between the two renames, or an older non-atomic writer) is
+# restored from .bak if the backup matches its own checksum. Otherwise a file
+# that still parses is kept and its stale .sha256 dropped, and one that doesn't
+# is moved aside. Abandoned temp files are removed.
+#
+# Each write costs two fsynced files (document + checksum) plus a directory
+# fsync; the backup is linked, not rewritten.
+#
+# Drainer counts in-flight requests so a shutdown hook can wait for them
+# before committing the volume. PeriodicCommit batches volume commits off the
+# request path for writers that don't need each write published at once.
+
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+# Seconds a shutting-down container waits for in-flight requests
+DRAIN_TIMEOUT = float(os.environ.get("DRAIN_TIMEOUT", 20))
+# Temp files older than this are leftovers from a killed writer
+STALE_TMP_SECONDS = 60
+
+
+def checksum(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # not supported on every filesystem
+    finally:
+        os.close(fd)
+
+
+def _write_file(path, raw: bytes):
+    """Write raw bytes to path via a unique temp file + rename."""
+    tmp = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(raw)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _link_file(src, dst):
+    """Point dst at src's current contents: a hard link, or a copy where links fail."""
+    tmp = f"{dst}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def atomic_write_json(path, data, indent=2) -> bytes:
+    """Atomically replace path with data as JSON. Returns the bytes written."""
+    raw = json.dumps(data, indent=indent).encode()
+    if os.path.exists(path):
+        # Keep the previous document and its checksum for recover(). path is
+        # replaced by a new inode below, so the link keeps the old contents
+        try:
+            _link_file(path, path + ".bak")
+            if os.path.exists(path + ".sha256"):
+                _link_file(path + ".sha256", path + ".bak.sha256")
+        except OSError as e:
+            print(f"Error backing up {path}: {str(e)}")
+    _write_file(path, raw)
+    _write_file(path + ".sha256", checksum(raw).encode())
+    _fsync_dir(path)
+    return raw
+
+
+def _read_valid(path):
+    """(raw bytes, checksum ok) if path holds parseable JSON, else None."""
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+        json.loads(raw)
+    except (FileNotFoundError, ValueError):
+        return None
+    try:
+        with open(path + ".sha256", "rb") as f:
+            expected = f.read().decode().strip()
+    except FileNotFoundError:
+        expected = None
+    return raw, expected == checksum(raw)
+
+
+def recover(path) -> str:
+    """Check and repair one state file. Returns what was done, for logging."""
+    now = time.time()
+    for tmp in glob.glob(glob.escape(path) + "*.tmp"):
+        try:
+            if now - os.stat(tmp).st_mtime > STALE_TMP_SECONDS:
+                os.remove(tmp)
+        except OSError:
+            pass
+
+    if not os.path.exists(path):
+        return "missing"
+
+    current = _read_valid(path)
+    if current is not None and current[1]:
+        return "ok"
+
+    # Unparseable, or not the document the last completed write produced
+    backup = _read_valid(path + ".bak")
+    if backup is not None and backup[1]:
+        shutil.copyfile(path, path + ".torn")
+        _write_file(path, backup[0])
+        _write_file(path + ".sha256", checksum(backup[0]).encode())
+        return "restored"
+
+    if current is not None:
+        # No trustworthy backup; keep the document, but not a checksum that doesn't match it
+        try:
+            os.remove(path + ".sha256")
+        except FileNotFoundError:
+            pass
+        return "unverified"
+
+    # Nothing usable; move the torn file aside so the app starts fresh
+    os.replace(path, path + ".torn")
+    return "quarantined"
+
+
+def recover_all(paths):
+    for path in paths:
+        try:
+            result = recover(path)
+        except OSError as e:
+            print(f"Error recovering {path}: {str(e)}")
+            continue
+        if result not in ("ok", "missing"):
+            print(f"Recovered {path}: {result}")
+
+
+class Drainer:
+    """Counts in-flight requests; drain() waits (bounded) for them to finish."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @asynccontextmanager
+    async def track(self):
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._idle.set()
+
+    async def run(self, awaitable):
+        """Await as one tracked request, e.g. a call that can outlive its HTTP request."""
+        async with self.track():
+            return await awaitable
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT) -> bool:
+        """True if every request finished within timeout."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            print(f"Shutdown with {self.in_flight} requests still in flight")
+            return False
+
+
+async def shutdown(drainer: Drainer, volume, timeout: float = DRAIN_TIMEOUT):
+    """Drain in-flight requests, then commit pending writes to the volume."""
+    await drainer.drain(timeout)
+    try:
+        await volume.commit.aio()
+    except Exception as e:
+        print(f"Error committing volume on shutdown: {str(e)}")
+
+
+class PeriodicCommit:
+    """Commits a volume from a background thread, at most every `interval`
+    seconds and only if mark() was called since the last commit.
+
+    flush() commits right away; call it on shutdown.
+    """
+
+    def __init__(self, volume, interval: float):
+        self.volume = volume
+        self.interval = interval
+        self._dirty = threading.Event()
+        self._commit_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def mark(self):
+        """Record that there are writes to publish; starts the thread on first use."""
+        self._dirty.set()
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="volume-commit", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        with self._commit_lock:
+            if not self._dirty.is_set():
+                return
+            # Cleared first: writes made during the commit are picked up next time
+            self._dirty.clear()
+            try:
+                self.volume.commit()
+            except Exception as e:
+                self._dirty.set()
+                print(f"Error committing volume: {str(e)}")
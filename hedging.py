@@ -0,0 +1,117 @@
+# hedging.py - hedged requests / fallback cascade for LLM-backed turns
+#
+# The primary backend gets a latency budget. If it hasn't answered by then,
+# the next backend in the cascade is started and raced against it, and so on;
+# whichever finishes first (successfully) wins and the rest are cancelled.
+# Backends are plain async callables, so tests and bench_hedging.py can inject
+# slow or failing fakes.
+
+import asyncio
+import time
+from collections import deque
+
+# Primary budget before the first fallback is started
+LATENCY_BUDGET = 4.0
+# Latency samples kept per backend
+WINDOW = 200
+
+
+class Backend:
+    """A named async callable that starts `start_after` seconds into the request."""
+
+    def __init__(self, name: str, call, start_after: float = 0.0):
+        self.name = name
+        self.call = call
+        self.start_after = start_after
+
+
+class LatencyTracker:
+    """Rolling latency window and outcome counters per backend.
+
+    Cancelled losers contribute their time-to-cancel, a lower bound on their
+    real latency; leaving them out would make a slow backend look fast.
+    """
+
+    def __init__(self, window: int = WINDOW):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+
+    def record(self, name: str, outcome: str, seconds: float = None):
+        counts = self.counts.setdefault(name, {"won": 0, "lost": 0, "error": 0})
+        counts[outcome] += 1
+        if seconds is not None:
+            self.samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, name: str, p: float):
+        samples = sorted(self.samples.get(name, ()))
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+    def stats(self):
+        return {
+            name: {
+                **counts,
+                "p50": self.percentile(name, 50),
+                "p95": self.percentile(name, 95),
+                "p99": self.percentile(name, 99),
+            }
+            for name, counts in self.counts.items()
+        }
+
+
+async def hedged_call(backends, tracker: LatencyTracker = None):
+    """Race the cascade. Returns (result, winning backend name).
+
+    A backend that fails brings the next one forward instead of waiting out
+    its delay. Raises the last error if every backend fails.
+    """
+    tracker = tracker or LatencyTracker()
+    start = time.monotonic()
+    pending = {}  # task -> backend
+    launched = {}  # task -> monotonic launch time
+    waiting = list(backends)
+    last_error = None
+
+    async def timed(backend):
+        began = time.monotonic()
+        result = await backend.call()
+        return result, time.monotonic() - began
+
+    try:
+        while waiting or pending:
+            # Launch every backend whose start time has come (or all of them
+            # if nothing is running any more)
+            elapsed = time.monotonic() - start
+            while waiting and (waiting[0].start_after <= elapsed or not pending):
+                backend = waiting.pop(0)
+                task = asyncio.ensure_future(timed(backend))
+                pending[task] = backend
+                launched[task] = time.monotonic()
+
+            timeout = waiting[0].start_after - (time.monotonic() - start) if waiting else None
+            done, _ = await asyncio.wait(
+                pending, timeout=max(0, timeout) if timeout is not None else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+
+            for task in done:
+                backend = pending.pop(task)
+                try:
+                    result, seconds = task.result()
+                except Exception as e:
+                    tracker.record(backend.name, "error")
+                    print(f"Backend {backend.name} failed: {str(e)}")
+                    last_error = e
+                    continue
+                tracker.record(backend.name, "won", seconds)
+                return result, backend.name
+
+        raise last_error or RuntimeError("No backends configured")
+    finally:
+        # Losers are cancelled; record how long they ran so slow backends show up in the stats
+        cancelled_at = time.monotonic()
+        for task, backend in pending.items():
+            task.cancel()
+            tracker.record(backend.name, "lost", cancelled_at - launched[task])
@@ -0,0 +1,115 @@
+# http_cache.py - response compression and cache validators shared by the web apps
+#
+# CompressionMiddleware negotiates brotli (if the brotli package is installed)
+# or gzip from Accept-Encoding and only compresses bodies above a size
+# threshold. make_etag / etag_matches back the ETag + 304 handling.
+
+import gzip
+import hashlib
+import json
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip always works
+    brotli = None
+
+MINIMUM_SIZE = 500  # bytes; smaller bodies aren't worth the CPU
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Streams must reach the client as they are produced
+SKIP_CONTENT_TYPES = ("text/event-stream",)
+
+
+def make_etag(*parts, weak: bool = False) -> str:
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else json.dumps(part, sort_keys=True).encode())
+    tag = f'"{digest.hexdigest()}"'
+    return f"W/{tag}" if weak else tag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
+def choose_encoding(accept_encoding: str):
+    """Best encoding we support from an Accept-Encoding header, or None."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    for encoding in (("br",) if brotli else ()) + ("gzip",):
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """ASGI middleware: brotli/gzip for responses at or above minimum_size bytes."""
+
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict((k.lower(), v) for k, v in scope.get("headers", []))
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        body = []
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                response_headers = dict((k.lower(), v) for k, v in message.get("headers", []))
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                if (b"content-encoding" in response_headers or content_type.startswith(SKIP_CONTENT_TYPES)
+                        or message["status"] in (204, 304)):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            payload = b"".join(body)
+            response_headers = [(k, v) for k, v in start.get("headers", []) if k.lower() != b"content-length"]
+            if len(payload) >= self.minimum_size:
+                payload = compress(payload, encoding)
+                response_headers.append((b"content-encoding", encoding.encode()))
+            response_headers.append((b"vary", b"Accept-Encoding"))
+            response_headers.append((b"content-length", str(len(payload)).encode()))
+            await send({**start, "headers": response_headers})
+            await send({"type": "http.response.body", "body": payload})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,94 @@
+# idempotency.py - idempotency keys + single-flight for interview turns
+#
+# Double-clicks and client retries resend the same chat turn. With a key per
+# turn, the first request does the work (one LLM call, one state write) and
+# every duplicate either waits on that same in-flight call or gets the stored
+# result replayed. Only client-supplied Idempotency-Keys are used: a key derived
+# from IP + answer would collide for users behind the same NAT.
+
+import asyncio
+import time
+from collections import OrderedDict
+
+from rate_limit import client_key
+
+IDEMPOTENCY_TTL = 600  # seconds a finished result is replayed
+MAX_STORED_RESULTS = 10000
+
+
+def turn_key(request, explicit_key: str) -> str:
+    """Store key for a client-supplied Idempotency-Key, scoped to the client."""
+    return f"{client_key(request)}:key:{explicit_key}"
+
+
+class SingleFlight:
+    """Run one call per key; concurrent callers share it, later ones get the stored result."""
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_results: int = MAX_STORED_RESULTS):
+        self.ttl = ttl
+        self.max_results = max_results
+        self.in_flight = {}  # key -> asyncio.Task
+        self.results = OrderedDict()  # key -> (expires_at, result)
+        self.executed = 0
+        self.coalesced = 0
+        self.replayed = 0
+
+    def _stored(self, key):
+        entry = self.results.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self.results[key]
+            return None
+        return entry
+
+    async def run(self, key: str, fn, cacheable=lambda result: True):
+        """Returns (result, replayed). fn is an async callable taking no arguments.
+
+        Results for which cacheable() is false (errors, 429s) are shared with
+        concurrent duplicates but not stored, so a later retry runs again.
+        """
+        stored = self._stored(key)
+        if stored is not None:
+            self.replayed += 1
+            return stored[1], True
+
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            # shield: a duplicate disconnecting must not cancel the shared call
+            return await asyncio.shield(task), True
+
+        # The call runs as its own task: if the leader's request is cancelled
+        # (client disconnect, input cancelled), duplicates still get the result
+        task = asyncio.ensure_future(fn())
+        self.in_flight[key] = task
+        self.executed += 1
+        task.add_done_callback(lambda done: self._finish(key, done, cacheable))
+        return await asyncio.shield(task), False
+
+    def _finish(self, key, task, cacheable):
+        del self.in_flight[key]
+        # exception() also marks an error nobody else awaited as retrieved
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if cacheable(result):
+            self.results[key] = (time.monotonic() + self.ttl, result)
+            if len(self.results) > self.max_results:
+                self.results.popitem(last=False)
+
+    def metrics(self):
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "replayed": self.replayed,
+            "in_flight": len(self.in_flight),
+            "stored_results": len(self.results),
+        }
+
+
+def is_cacheable(result) -> bool:
+    """Only successful dict payloads are replayed; errors and 429s are retried for real."""
+    return isinstance(result, dict) and "error" not in result
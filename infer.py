@@ -1,12 +1,37 @@
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+
 import modal
 
+MODEL_ID = "mistralai/Mistral-7B-Instruct-v0.1"
+
+# Warm pool: containers kept running even with no traffic, and how long an
+# idle container stays up before scaling down
+MIN_WARM_CONTAINERS = int(os.environ.get("INTERVIEW_MIN_WARM_CONTAINERS", 0))
+IDLE_TIMEOUT = int(os.environ.get("INTERVIEW_IDLE_TIMEOUT", 300))
+
 # Create Modal app
 app = modal.App("interview-app")
 
+
+def download_model():
+    """Bake the weights into the image so containers never download at runtime."""
+    from huggingface_hub import snapshot_download
+
+    # Only the safetensors shards, not the duplicate .bin checkpoint
+    snapshot_download(MODEL_ID, allow_patterns=["*.json", "*.safetensors", "tokenizer.model"])
+
+
 # Create image with necessary dependencies
 image = (modal.Image.debian_slim()
-         .pip_install("transformers==4.36.2", "torch", "accelerate==0.26.1")
-         .run_commands("apt-get update", "apt-get install -y git"))
+         .pip_install("transformers==4.36.2", "torch", "accelerate==0.26.1",
+                      "huggingface_hub", "safetensors")
+         .run_commands("apt-get update", "apt-get install -y git")
+         .run_function(download_model)
+         .env({"HF_HUB_OFFLINE": "1"}))
 
 # Questions list
 QUESTIONS = [
@@ -14,31 +39,78 @@ QUESTIONS = [
     "Anything else you'd like to add?"
 ]
 
-@app.function(
-    image=image,
-    gpu="A100",
-    memory=32000,
-    timeout=120
-)
-def generate_response(conversation_history):
-    """Generate a follow-up question based on conversation history."""
+# Marker the model uses to end the interview
+COMPLETE_MARKER = "INTERVIEW_COMPLETE"
+
+# Fields of the structured interview summary, with the instruction for each
+SUMMARY_FIELDS = {
+    "technical_requirements": "the technical requirements",
+    "timeline": "the timeline",
+    "challenges": "the potential challenges",
+    "destination_country": "the destination country, or unknown",
+    "summary": "a one sentence summary of the project",
+}
+
+
+# End of the first question, or of the first sentence ('.' / '!' followed by
+# whitespace, so "3.5" or "e.g" mid-word don't count)
+FOLLOW_UP_END = re.compile(r"\?|[.!](?=\s)")
+
+
+def follow_up_end(text: str):
+    """(stop reason, end index) of the first finished question or sentence, else (None, None)."""
+    match = FOLLOW_UP_END.search(text)
+    if match is None:
+        return None, None
+    return ("question" if match.group() == "?" else "sentence"), match.end()
+
+
+class FollowUpStop:
+    """Stop once the follow-up is finished or the interview is complete.
+
+    Generation ends at the first question or sentence (one question per turn)
+    or as soon as the INTERVIEW_COMPLETE marker shows up, instead of running
+    to max_new_tokens. reason says which one fired.
+    """
+
+    def __init__(self, tokenizer, prompt_length: int):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.reason = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        text = self.tokenizer.decode(input_ids[0, self.prompt_length:], skip_special_tokens=True)
+        if COMPLETE_MARKER in text:
+            self.reason = "complete"
+        else:
+            self.reason, _ = follow_up_end(text)
+        return self.reason is not None
+
+
+class ClosingQuoteStop:
+    """Stop at the closing quote of a JSON string value."""
+
+    def __init__(self, tokenizer, prompt_length: int):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+
+    def __call__(self, input_ids, scores, **kwargs):
+        text = self.tokenizer.decode(input_ids[0, self.prompt_length:], skip_special_tokens=True)
+        return '"' in text or "\n" in text
+
+
+def parse_summary(response: str):
+    """Structured summary dict from an INTERVIEW_COMPLETE reply, or None."""
+    _, _, payload = response.partition(f"{COMPLETE_MARKER}:")
     try:
-        # Import dependencies inside the function where they'll be used
-        import torch
-        from transformers import AutoModelForCausalLM, AutoTokenizer
-        
-        MODEL_ID = "mistralai/Mistral-7B-Instruct-v0.1"
-        
-        # Initialize model and tokenizer
-        tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
-        model = AutoModelForCausalLM.from_pretrained(
-            MODEL_ID,
-            torch_dtype=torch.float16,
-            device_map="auto"
-        )
-        
-        # Create the prompt
-        prompt = """<s>[INST] You are interviewing someone about their project. Based on their responses, ask ONE specific follow-up question about:
+        summary = json.loads(payload)
+    except ValueError:
+        return None
+    return summary if isinstance(summary, dict) else None
+
+
+# Static instructions, sent as the start of the user turn
+PREAMBLE = """You are interviewing someone about their project. Based on their responses, ask ONE specific follow-up question about:
 1. Technical requirements
 2. Timeline
 3. Potential challenges
@@ -47,32 +119,260 @@ If you have enough information about all these aspects, respond with: 'INTERVIEW
 
 Current conversation:
 """
-        for entry in conversation_history:
-            prompt += f"\nQuestion: {entry['question']}\nAnswer: {entry['response']}\n"
-        prompt += "\nAsk your next question or conclude the interview.[/INST]"
-        
-        # Generate response
-        inputs = tokenizer(prompt, return_tensors="pt").to("cuda")
+CLOSING = "\nAsk your next question or conclude the interview."
+
+
+def format_turn(entry) -> str:
+    return f"\nQuestion: {entry['question']}\nAnswer: {entry['response']}\n"
+
+
+def prompt_text(conversation_history) -> str:
+    """The user message of the next-question prompt."""
+    return PREAMBLE + "".join(format_turn(entry) for entry in conversation_history) + CLOSING
+
+
+class PromptBuilder:
+    """Builds prompt token ids from the tokenizer's chat template, incrementally.
+
+    The template is rendered once around a placeholder to find the text that
+    wraps the user message. The preamble and closing are tokenized once, and
+    each session keeps the token ids of the turns it has already seen, so a new
+    turn only tokenizes that turn no matter how long the conversation is.
+    Cached ids are only reused if a digest of those turns' text still matches,
+    so two conversations sharing a session id can never see each other's turns.
+
+    The ids must equal tokenizing the whole rendered template in one go. Pieces
+    are therefore cut right after the blank line between turns (a token
+    boundary for SentencePiece and byte-level BPE alike) and encoded behind a
+    newline anchor whose ids are dropped, so SentencePiece doesn't add its
+    leading "▁" to each piece. The constructor checks this on a probe
+    conversation; a tokenizer that still disagrees gets the whole prompt
+    tokenized every turn instead.
+    """
+
+    PLACEHOLDER = "\x00CONTENT\x00"
+    ANCHOR = "\n"
+
+    def __init__(self, tokenizer, max_sessions: int = 1024):
+        self.tokenizer = tokenizer
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()  # session_id -> (turns encoded, digest of their text, token ids)
+
+        rendered = tokenizer.apply_chat_template(
+            [{"role": "user", "content": self.PLACEHOLDER}], tokenize=False
+        )
+        self.head, self.tail = rendered.split(self.PLACEHOLDER)
+        self.anchor_ids = self._encode(self.ANCHOR)
+        # Rendered text is head + PREAMBLE + "\n" + ("Question...\n" + "\n")* + "Ask..." + tail
+        self.head_ids = self._encode(self.head + PREAMBLE + "\n")
+        self.tail_ids = self._encode_piece(CLOSING[1:] + self.tail)
+
+        probe = [{"question": QUESTIONS[0], "response": "A parcel."},
+                 {"question": QUESTIONS[1], "response": "No, thanks!"}]
+        self.incremental = self._incremental_ids(probe, None) == self.full_ids(probe)
+        if not self.incremental:
+            print("PromptBuilder: incremental ids differ from the chat template, tokenizing whole prompts")
+
+    def _encode(self, text: str):
+        # Special tokens (e.g. <s>) come from the template text itself
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def _encode_piece(self, text: str):
+        """Ids of text as it tokenizes after a newline, not at the start of a string."""
+        ids = self._encode(self.ANCHOR + text)
+        anchor = len(self.anchor_ids)
+        if ids[:anchor] != self.anchor_ids:
+            # Anchor merged into the text; caught by the probe in __init__
+            return ids
+        return ids[anchor:]
+
+    @staticmethod
+    def _piece(entry) -> str:
+        # format_turn's leading newline belongs to the previous piece
+        return format_turn(entry)[1:] + "\n"
+
+    def full_ids(self, conversation_history):
+        """Token ids of the whole rendered chat template, tokenized in one go."""
+        return self.tokenizer.apply_chat_template(
+            [{"role": "user", "content": prompt_text(conversation_history)}], tokenize=True
+        )
+
+    def input_ids(self, conversation_history, session_id: str = None):
+        """Token ids for the next-question prompt of this conversation."""
+        if not self.incremental:
+            return self.full_ids(conversation_history)
+        return self._incremental_ids(conversation_history, session_id)
+
+    def _incremental_ids(self, conversation_history, session_id):
+        seen, digest, turn_ids = self.sessions.pop(session_id, (0, None, []))
+        texts = [self._piece(entry) for entry in conversation_history]
+
+        # Hashing text is far cheaper than tokenizing it; a mismatch means a
+        # restarted or different conversation under the same id
+        hasher = hashlib.sha1()
+        for text in texts[:seen]:
+            hasher.update(text.encode())
+        if seen > len(texts) or (seen and hasher.hexdigest() != digest):
+            seen, turn_ids = 0, []
+            hasher = hashlib.sha1()
+
+        for text in texts[seen:]:
+            turn_ids.extend(self._encode_piece(text))
+            hasher.update(text.encode())
+
+        if session_id is not None:
+            self.sessions[session_id] = (len(texts), hasher.hexdigest(), turn_ids)
+            if len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+        return self.head_ids + turn_ids + self.tail_ids
+
+
+def generate_follow_up(model, tokenizer, prompt_ids, max_new_tokens: int = 150, early_exit: bool = True):
+    """Generate the next turn. Returns (text, tokens generated, stop reason).
+
+    The stop reason is "complete" (completion marker), "question" or "sentence"
+    (early exit), "length" (ran to max_new_tokens) or "eos".
+    """
+    import torch
+    from transformers import StoppingCriteriaList
+
+    input_ids = torch.tensor([prompt_ids], device=model.device)
+    prompt_length = input_ids.shape[1]
+    stop = FollowUpStop(tokenizer, prompt_length)
+
+    with torch.no_grad():
+        outputs = model.generate(
+            input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=max_new_tokens,
+            temperature=0.7,
+            top_p=0.9,
+            do_sample=True,
+            pad_token_id=tokenizer.eos_token_id,
+            stopping_criteria=StoppingCriteriaList([stop]) if early_exit else None
+        )
+
+    new_tokens = outputs[0, prompt_length:]
+    text = tokenizer.decode(new_tokens, skip_special_tokens=True).strip()
+    if COMPLETE_MARKER in text:
+        return text, len(new_tokens), "complete"
+    if early_exit and stop.reason is not None:
+        # Drop anything decoded past the question / sentence end in the final step
+        reason, end = follow_up_end(text)
+        return text[:end], len(new_tokens), reason
+    return text, len(new_tokens), "length" if len(new_tokens) >= max_new_tokens else "eos"
+
+
+def generate_summary_json(model, tokenizer, conversation_history, max_value_tokens: int = 60):
+    """Constrained summary: the JSON skeleton is fixed, the model only fills string values.
+
+    Each value is generated greedily and stops at its closing quote, so the
+    result always parses. Returns (summary dict, tokens generated).
+    """
+    import torch
+    from transformers import StoppingCriteriaList
+
+    # Through the chat template, like the follow-up prompt; it already has the BOS token
+    content = "Summarise this project interview as JSON.\n"
+    content += "".join(format_turn(entry) for entry in conversation_history)
+    prompt = tokenizer.apply_chat_template(
+        [{"role": "user", "content": content}], tokenize=False, add_generation_prompt=True
+    ) + " {"
+
+    summary = {}
+    total_tokens = 0
+    for field, description in SUMMARY_FIELDS.items():
+        # Feed back what we have so far, then open the next value
+        partial = prompt + ", ".join(f'"{k}": {json.dumps(v)}' for k, v in summary.items())
+        partial += (", " if summary else "") + f'"{field}" ({description}): "'
+        inputs = tokenizer(partial, return_tensors="pt", add_special_tokens=False).to(model.device)
+        prompt_length = inputs["input_ids"].shape[1]
+
         with torch.no_grad():
             outputs = model.generate(
                 inputs["input_ids"],
-                max_new_tokens=150,
-                temperature=0.7,
-                top_p=0.9,
-                do_sample=True,
-                pad_token_id=tokenizer.eos_token_id
+                attention_mask=inputs["attention_mask"],
+                max_new_tokens=max_value_tokens,
+                do_sample=False,
+                pad_token_id=tokenizer.eos_token_id,
+                stopping_criteria=StoppingCriteriaList([ClosingQuoteStop(tokenizer, prompt_length)])
             )
-        
-        response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        response = response.split("[/INST]")[-1].strip()
-        
-        # Clean up
-        del model
-        del tokenizer
-        torch.cuda.empty_cache()
-        
-        return response
-        
-    except Exception as e:
-        print(f"Error in generate_response: {str(e)}")
-        return "I apologize, but I encountered an error. Could you please provide more details about your project?" 
\ No newline at end of file
+
+        new_tokens = outputs[0, prompt_length:]
+        total_tokens += len(new_tokens)
+        value = tokenizer.decode(new_tokens, skip_special_tokens=True)
+        summary[field] = value.split('"')[0].split("\n")[0].strip()
+
+    return summary, total_tokens
+
+
+def load_model(model_id: str = MODEL_ID, device_map: str = "auto", dtype: str = None):
+    """Load tokenizer + model from the local snapshot; safetensors shards are memory-mapped.
+
+    dtype defaults to float16 on GPU and float32 on CPU, where fp16 is slow or unsupported.
+    """
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    if dtype is None:
+        dtype = "float32" if device_map == "cpu" else "float16"
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_id,
+        torch_dtype=getattr(torch, dtype),
+        device_map=device_map,
+        use_safetensors=True,
+        low_cpu_mem_usage=True
+    )
+    model.eval()
+    return tokenizer, model
+
+
+def warm_up(model, builder):
+    """One tiny generation so CUDA kernels and caches are ready before real traffic."""
+    prompt_ids = builder.input_ids([{"question": QUESTIONS[0], "response": "A parcel."}])
+    generate_follow_up(model, builder.tokenizer, prompt_ids, max_new_tokens=4)
+
+
+@app.cls(
+    image=image,
+    gpu="A100",
+    memory=32000,
+    timeout=120,
+    keep_warm=MIN_WARM_CONTAINERS,
+    container_idle_timeout=IDLE_TIMEOUT
+)
+class Interviewer:
+    @modal.enter()
+    def load(self):
+        """Runs once per container, before it takes any request."""
+        self.tokenizer, self.model = load_model()
+        # Prompt cache lives for the life of the container
+        self.builder = PromptBuilder(self.tokenizer)
+        warm_up(self.model, self.builder)
+
+    @modal.method()
+    def generate_response(self, conversation_history, structured_summary: bool = True, session_id: str = None):
+        """Generate a follow-up question based on conversation history.
+
+        When the model decides the interview is complete the reply is
+        'INTERVIEW_COMPLETE: <summary>', where the summary is JSON if
+        structured_summary is set. session_id lets the prompt builder reuse the
+        token ids of turns it has already seen.
+        """
+        try:
+            # Generate response, stopping early at the question / completion marker
+            prompt_ids = self.builder.input_ids(conversation_history, session_id)
+            response, _, reason = generate_follow_up(self.model, self.tokenizer, prompt_ids)
+
+            if reason == "complete" and structured_summary:
+                summary, _ = generate_summary_json(self.model, self.tokenizer, conversation_history)
+                response = f"{COMPLETE_MARKER}: {json.dumps(summary)}"
+
+            return response
+
+        except Exception as e:
+            print(f"Error in generate_response: {str(e)}")
+            return "I apologize, but I encountered an error. Could you please provide more details about your project?"
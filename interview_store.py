@@ -0,0 +1,335 @@
+# interview_store.py - indexed store of every interview, next to responses.json
+#
+# responses.json only ever holds the current interview. Every interview is
+# also kept as a row in SQLite on the volume, with indexes for the filters the
+# ops team uses, so queries never re-read and re-parse everything.
+# InterviewSummary keeps the polling numbers in memory and updates them per
+# write instead of recounting. The writer also stores them in the counts
+# tables in the same transaction as the row, so a reader gets them with two
+# small selects instead of a scan of every interview.
+#
+# Single writer: a Modal Volume is last-writer-wins per file and each container
+# works on its own copy, so two containers committing interviews.db would drop
+# each other's rows. Exactly one container may open the store for writing; the
+# apps enforce that with concurrency_limit=1 on the function that owns it and
+# commit the volume after writes. Other functions open it with readonly=True
+# after volume.reload(); a long-lived reader calls refresh(volume.reload),
+# which closes the connection around the reload.
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+DB_PATH = "/data/interviews.db"
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS interviews (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL UNIQUE,      -- YYYYMMDD_HHMMSS, same as responses.json
+    completed INTEGER NOT NULL DEFAULT 0,
+    country TEXT,
+    project_description TEXT,
+    num_responses INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,                   -- the responses.json document
+    completed_at TEXT                     -- YYYYMMDD_HHMMSS, set once on completion
+);
+CREATE INDEX IF NOT EXISTS idx_interviews_started ON interviews (started_at);
+CREATE INDEX IF NOT EXISTS idx_interviews_completed ON interviews (completed, started_at);
+CREATE INDEX IF NOT EXISTS idx_interviews_country ON interviews (country, started_at);
+"""
+
+# Indexes on columns added after the first release, created after migrating
+LATE_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_interviews_completed_at ON interviews (completed_at, id);
+"""
+
+# Summary counters, kept current by the writer
+COUNTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS interview_totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL,
+    latest_started_at TEXT
+);
+CREATE TABLE IF NOT EXISTS interview_countries (
+    country TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+"""
+
+# Full text index for keyword search, if this sqlite build has FTS5
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS interviews_fts USING fts5(
+    project_description, content='interviews', content_rowid='id'
+);
+"""
+
+
+class InterviewSummary:
+    """Counts for polling, updated incrementally as interviews are written."""
+
+    def __init__(self):
+        self.total = 0
+        self.completed = 0
+        self.by_country = {}
+        self.latest_started_at = None
+
+    def load(self, conn) -> bool:
+        """Read the stored counters. False if there are none yet (database
+        from before the counts tables, or not written since)."""
+        try:
+            totals = conn.execute(
+                "SELECT total, completed, latest_started_at FROM interview_totals WHERE id = 0"
+            ).fetchone()
+        except sqlite3.OperationalError:
+            return False
+        if totals is None:
+            return False
+        self.total, self.completed, self.latest_started_at = totals
+        self.by_country = dict(conn.execute("SELECT country, count FROM interview_countries").fetchall())
+        return True
+
+    def recount(self, conn):
+        """Full recount over every interview."""
+        self.total, self.completed, self.latest_started_at = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(completed), 0), MAX(started_at) FROM interviews"
+        ).fetchone()
+        self.by_country = dict(conn.execute(
+            "SELECT country, COUNT(*) FROM interviews WHERE country IS NOT NULL GROUP BY country"
+        ).fetchall())
+
+    def store(self, conn, countries=None):
+        """Write the counters (only the given countries, or all of them); the caller commits."""
+        conn.execute(
+            "INSERT OR REPLACE INTO interview_totals (id, total, completed, latest_started_at) VALUES (0, ?, ?, ?)",
+            (self.total, self.completed, self.latest_started_at)
+        )
+        if countries is None:
+            conn.execute("DELETE FROM interview_countries")
+            countries = self.by_country
+        for country in countries:
+            if country in self.by_country:
+                conn.execute(
+                    "INSERT OR REPLACE INTO interview_countries (country, count) VALUES (?, ?)",
+                    (country, self.by_country[country])
+                )
+            else:
+                conn.execute("DELETE FROM interview_countries WHERE country = ?", (country,))
+
+    def to_dict(self):
+        return {
+            "total": self.total,
+            "completed": self.completed,
+            "incomplete": self.total - self.completed,
+            "by_country": dict(self.by_country),
+            "latest_started_at": self.latest_started_at,
+        }
+
+
+class InterviewStore:
+    def __init__(self, path: str = DB_PATH, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+        self.lock = threading.Lock()
+        self.summary = InterviewSummary()
+        if readonly:
+            self._open_readonly()
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.executescript(SCHEMA)
+            self._migrate()
+            self.conn.executescript(LATE_SCHEMA)
+            self.conn.executescript(COUNTS_SCHEMA)
+            try:
+                self.conn.executescript(FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                self.has_fts = False
+            if not self.summary.load(self.conn):
+                # First open since the counts tables were added
+                self.summary.recount(self.conn)
+                self.summary.store(self.conn)
+            self.conn.commit()
+
+    def _open_readonly(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(self.path)
+        # Readers must never write to their copy of the file
+        self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        self.has_fts = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'interviews_fts'"
+        ).fetchone() is not None
+        if not self.summary.load(self.conn):
+            # Written by a version without the counts tables
+            self.summary.recount(self.conn)
+
+    def refresh(self, reload):
+        """Read-only stores: close the connection, call reload() (volume.reload),
+        reopen. Costs two small selects, however many interviews there are."""
+        with self.lock:
+            self.conn.close()
+            reload()
+            self._open_readonly()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _migrate(self):
+        # Databases created before completed_at existed
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(interviews)")}
+        if "completed_at" not in columns:
+            self.conn.execute("ALTER TABLE interviews ADD COLUMN completed_at TEXT")
+
+    def _index_text(self, row_id, old_text, new_text):
+        if not self.has_fts or old_text == new_text:
+            return
+        if old_text is not None:
+            self.conn.execute(
+                "INSERT INTO interviews_fts (interviews_fts, rowid, project_description) VALUES ('delete', ?, ?)",
+                (row_id, old_text)
+            )
+        if new_text is not None:
+            self.conn.execute(
+                "INSERT INTO interviews_fts (rowid, project_description) VALUES (?, ?)",
+                (row_id, new_text)
+            )
+
+    def save(self, data, completed: bool = False, country: str = None):
+        """Insert or update the interview for this responses.json document."""
+        started_at = data["timestamp_started"]
+        now = datetime.now().strftime("%Y%m%d_%H%M%S")
+        responses = data.get("responses", [])
+        project_description = responses[0]["response"] if responses else None
+
+        if self.readonly:
+            raise RuntimeError("InterviewStore opened read-only")
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, completed, country, project_description FROM interviews WHERE started_at = ?",
+                (started_at,)
+            ).fetchone()
+
+            if row is None:
+                cur = self.conn.execute(
+                    "INSERT INTO interviews (started_at, completed, country, project_description, num_responses, data, completed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (started_at, int(completed), country, project_description, len(responses), json.dumps(data),
+                     now if completed else None)
+                )
+                row_id, was_completed, old_country, old_text = cur.lastrowid, False, None, None
+                self.summary.total += 1
+            else:
+                row_id, was_completed, old_country, old_text = row
+                completed = completed or bool(was_completed)
+                country = country or old_country
+                self.conn.execute(
+                    "UPDATE interviews SET completed = ?, country = ?, project_description = ?, "
+                    "num_responses = ?, data = ?, completed_at = COALESCE(completed_at, ?) WHERE id = ?",
+                    (int(completed), country, project_description, len(responses), json.dumps(data),
+                     now if completed else None, row_id)
+                )
+
+            self._index_text(row_id, old_text, project_description)
+
+            # Incremental summary update, stored in the same transaction as the row
+            if completed and not was_completed:
+                self.summary.completed += 1
+            changed = []
+            if country != old_country:
+                if old_country:
+                    self.summary.by_country[old_country] -= 1
+                    if not self.summary.by_country[old_country]:
+                        del self.summary.by_country[old_country]
+                if country:
+                    self.summary.by_country[country] = self.summary.by_country.get(country, 0) + 1
+                changed = [c for c in (old_country, country) if c]
+            if self.summary.latest_started_at is None or started_at > self.summary.latest_started_at:
+                self.summary.latest_started_at = started_at
+            self.summary.store(self.conn, changed)
+            self.conn.commit()
+
+    def get_summary(self):
+        with self.lock:
+            return self.summary.to_dict()
+
+    def query(self, started_from: str = None, started_to: str = None, completed: bool = None,
+              country: str = None, keyword: str = None, cursor: int = None, limit: int = DEFAULT_PAGE_SIZE):
+        """Filtered page of interviews, newest first. Pass next_cursor back to get the next page."""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        where, params = [], []
+
+        # Dates are compared as YYYYMMDD prefixes of started_at
+        if started_from:
+            where.append("i.started_at >= ?")
+            params.append(started_from)
+        if started_to:
+            where.append("i.started_at < ?")
+            params.append(started_to + "~")  # inclusive of the whole end day
+        if completed is not None:
+            where.append("i.completed = ?")
+            params.append(int(completed))
+        if country:
+            where.append("i.country = ?")
+            params.append(country)
+        if keyword:
+            if self.has_fts:
+                where.append("i.id IN (SELECT rowid FROM interviews_fts WHERE interviews_fts MATCH ?)")
+                params.append('"' + keyword.replace('"', '""') + '"')
+            else:
+                where.append("i.project_description LIKE ?")
+                params.append(f"%{keyword}%")
+        if cursor is not None:
+            where.append("i.id < ?")
+            params.append(cursor)
+
+        sql = "SELECT i.id, i.started_at, i.completed, i.country, i.project_description, i.num_responses, i.data FROM interviews i"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY i.id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+
+        items = [
+            {
+                "id": row_id,
+                "timestamp_started": started_at,
+                "completed": bool(done),
+                "country": row_country,
+                "project_description": description,
+                "num_responses": num_responses,
+                "responses": json.loads(data).get("responses", []),
+            }
+            for row_id, started_at, done, row_country, description, num_responses, data in rows[:limit]
+        ]
+        next_cursor = items[-1]["id"] if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def completed_since(self, after_at: str = "", after_id: int = 0, limit: int = 1000):
+        """Completed interviews in (completed_at, id) order after the given checkpoint."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, started_at, completed_at, country, project_description, num_responses, data "
+                "FROM interviews WHERE completed_at IS NOT NULL AND (completed_at, id) > (?, ?) "
+                "ORDER BY completed_at, id LIMIT ?",
+                (after_at, after_id, limit)
+            ).fetchall()
+        return [
+            {
+                "id": row_id,
+                "timestamp_started": started_at,
+                "completed_at": completed_at,
+                "country": country,
+                "project_description": description,
+                "num_responses": num_responses,
+                "data": json.loads(data),
+            }
+            for row_id, started_at, completed_at, country, description, num_responses, data in rows
+        ]
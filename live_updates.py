@@ -0,0 +1,119 @@
+# live_updates.py - server-sent events and ETags for the interview UI
+#
+# index.html used to re-download the whole responses document on every
+# refresh. Now:
+# - check_responses sends an ETag and answers If-None-Match with a 304
+#   (helpers in http_cache.py)
+# - /events streams only what changed: new responses since the client's last
+#   event id, plus interview progress published by the interview handler
+#
+# Both only work inside one container: the Broadcaster fans out in-process,
+# and the stream polls this container's view of responses.json (a Modal
+# Volume doesn't show other containers' writes without a reload). Modal_ai
+# therefore runs its ASGI app in a single container (concurrency_limit=1,
+# allow_concurrent_inputs) that is also the only writer of responses.json.
+# Every open stream holds one of that container's inputs, so the number of
+# streams is capped well below the input limit (Broadcaster.max_subscribers);
+# extra clients get a 429 with Retry-After and interview turns keep a slot.
+
+import asyncio
+import json
+import os
+
+# How often the stream checks responses.json, and how often it sends a keep-alive
+POLL_INTERVAL = 1.0
+KEEPALIVE_INTERVAL = 15.0
+# Open /events streams per container, and the Retry-After for clients over it
+MAX_SUBSCRIBERS = int(os.environ.get("MAX_EVENT_STREAMS", 40))
+SUBSCRIBER_RETRY_AFTER = 30
+
+
+def sse_event(event: str, data, event_id: str = None) -> str:
+    """One text/event-stream message."""
+    message = ""
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    message += f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return message
+
+
+def parse_event_id(event_id: str):
+    """'<timestamp_started>:<number of responses seen>' -> (timestamp, count)."""
+    if not event_id or ":" not in event_id:
+        return None, 0
+    started, _, count = event_id.rpartition(":")
+    try:
+        return started, int(count)
+    except ValueError:
+        return None, 0
+
+
+class Broadcaster:
+    """In-process fan-out of progress events to every open /events stream."""
+
+    def __init__(self, max_pending: int = 100, max_subscribers: int = MAX_SUBSCRIBERS):
+        self.max_pending = max_pending
+        self.max_subscribers = max_subscribers
+        self.subscribers = set()
+
+    def full(self) -> bool:
+        """True if a new stream should be turned away."""
+        return len(self.subscribers) >= self.max_subscribers
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_pending)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event: str, data):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                # A stalled client loses progress events, never blocks the handler
+                pass
+
+
+async def response_stream(load_responses, broadcaster: Broadcaster, last_event_id: str = None):
+    """Yield SSE messages: deltas of responses.json and published progress events.
+
+    load_responses() returns the current responses document (or None) and must
+    be cheap when nothing changed, e.g. the mtime-keyed cache in Modal_ai.
+    """
+    seen_started, seen_count = parse_event_id(last_event_id)
+    queue = broadcaster.subscribe()
+    idle = 0.0
+    try:
+        while True:
+            data = load_responses()
+            if data is not None:
+                started = data["timestamp_started"]
+                responses = data["responses"]
+                if started != seen_started:
+                    # New interview (or first connect): send the whole document once
+                    seen_started, seen_count = started, len(responses)
+                    yield sse_event("reset", data, f"{started}:{seen_count}")
+                    idle = 0.0
+                elif len(responses) > seen_count:
+                    yield sse_event(
+                        "responses",
+                        {"timestamp_started": started, "from_index": seen_count, "responses": responses[seen_count:]},
+                        f"{started}:{len(responses)}"
+                    )
+                    seen_count = len(responses)
+                    idle = 0.0
+
+            try:
+                event, payload = await asyncio.wait_for(queue.get(), timeout=POLL_INTERVAL)
+                yield sse_event(event, payload)
+                idle = 0.0
+            except asyncio.TimeoutError:
+                idle += POLL_INTERVAL
+                if idle >= KEEPALIVE_INTERVAL:
+                    yield ": keep-alive\n\n"
+                    idle = 0.0
+    finally:
+        broadcaster.unsubscribe(queue)
@@ -1,13 +1,21 @@
 # modal_shipping_api.py - Modal FastAPI app for shipping recommendations
 
+import asyncio
+import atexit
+import os
 import time
 import json
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import datetime
+from typing import Optional, Dict, Any, List
 from pydantic import BaseModel, Field
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import modal
+from http_cache import CompressionMiddleware
+from profiling import add_profiling, profile_secrets
+from durable import PeriodicCommit
+from quote_engine import quote_from_request, quote_batch, quote_record, log_quotes, QUOTE_WORKERS
 
 # Define the FastAPI app
 web_app = FastAPI()
@@ -21,6 +29,16 @@ web_app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress quote text (br if available, else gzip) above the size threshold
+web_app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+# On-demand profiler (X-Profile header / /admin/profile), only when PROFILE_TOKEN is set
+# (deploy with PROFILE_SECRET=<secret name> to attach it, see README)
+add_profiling(web_app)
+
+# Health payload is rebuilt at most this often
+HEALTH_TTL = 5
+
 # Define data models
 class ContactInfo(BaseModel):
     email: str
@@ -69,139 +87,62 @@ class ShippingRecommendation(BaseModel):
     modelUsed: str = Field(default="Modal Shipping API")
     processingTime: float
 
-# Helper function to parse natural language dates
-def parse_date(date_string: str) -> str:
-    """
-    Converts natural language date strings to YYYY-MM-DD format.
-    Falls back to current date + offset if parsing fails.
-    """
-    # If it's already in YYYY-MM-DD format, return it
-    try:
-        datetime.strptime(date_string, "%Y-%m-%d")
-        return date_string
-    except ValueError:
-        pass
-    
-    # Handle common natural language date phrases
-    today = datetime.now()
-    date_string = date_string.lower()
-    
-    if "today" in date_string:
-        return today.strftime("%Y-%m-%d")
-    elif "tomorrow" in date_string:
-        return (today + timedelta(days=1)).strftime("%Y-%m-%d")
-    elif "next day" in date_string:
-        return (today + timedelta(days=1)).strftime("%Y-%m-%d")
-    elif "weekend" in date_string:
-        # Find the next Saturday
-        days_until_saturday = (5 - today.weekday()) % 7
-        if days_until_saturday == 0:
-            days_until_saturday = 7
-        return (today + timedelta(days=days_until_saturday)).strftime("%Y-%m-%d")
-    elif "week" in date_string:
-        return (today + timedelta(days=7)).strftime("%Y-%m-%d")
-    elif "month" in date_string:
-        return (today + timedelta(days=30)).strftime("%Y-%m-%d")
-    elif "april" in date_string or "apr" in date_string:
-        april = datetime(today.year, 4, 15)
-        if today > april:
-            april = datetime(today.year + 1, 4, 15)
-        return april.strftime("%Y-%m-%d")
-    elif "may" in date_string:
-        may = datetime(today.year, 5, 15)
-        if today > may:
-            may = datetime(today.year + 1, 5, 15)
-        return may.strftime("%Y-%m-%d")
-    elif "june" in date_string or "jun" in date_string:
-        june = datetime(today.year, 6, 15)
-        if today > june:
-            june = datetime(today.year + 1, 6, 15)
-        return june.strftime("%Y-%m-%d")
-    else:
-        # Default to a week from now for any other phrase
-        return (today + timedelta(days=7)).strftime("%Y-%m-%d")
+class BatchShippingRequest(BaseModel):
+    requests: List[ShippingRequest]
+    # Shard count, 1..QUOTE_WORKERS; defaults to QUOTE_WORKERS
+    workers: Optional[int] = Field(default=None, ge=1, le=QUOTE_WORKERS)
+
+class BatchShippingRecommendation(BaseModel):
+    texts: List[str]
+    modelUsed: str = Field(default="Modal Shipping API")
+    workers: int
+    processingTime: float
 
 # Define the Modal image with python dependencies
 image = modal.Image.debian_slim().pip_install(
     "fastapi>=0.95.0", 
     "pydantic>=2.0.0",
-)
+    "brotli",  # CompressionMiddleware falls back to gzip without it
+).env({"QUOTE_WORKERS": str(QUOTE_WORKERS)})
 
 # Define the Modal app
 app = modal.App("shipping-logistics-fastapi")
 
-# Add the endpoint to FastAPI app as well, for better debugging
-@web_app.post("/api/shipping/recommend")
-async def web_app_shipping_recommend(shipping_request: ShippingRequest):
-    """FastAPI endpoint for shipping recommendations."""
-    try:
-        # Record start time for processing time calculation
-        start_time = time.time()
-        
-        # Extract key information
-        product = shipping_request.product
-        destination = shipping_request.destination
-        special_requirements = shipping_request.special_requirements
-        is_fragile = "fragile" in special_requirements.lower()
-        
-        # Parse dates from the timeline - handling natural language
-        pickup_date_str = parse_date(shipping_request.timeline.pickup_date)
-        delivery_date_str = parse_date(shipping_request.timeline.delivery_deadline)
-        
-        # Calculate days between pickup and delivery
-        pickup_date = datetime.strptime(pickup_date_str, "%Y-%m-%d")
-        delivery_date = datetime.strptime(delivery_date_str, "%Y-%m-%d")
-        delivery_days = (delivery_date - pickup_date).days
-        
-        # Calculate shipping prices based on weight and dimensions
-        base_standard = 15 
-        base_express = 25
-        base_priority = 35
-        
-        # Weight factor
-        weight_factor = product.weight.value * 2
-        
-        # Size factor (approximation of volume)
-        volume = product.dimensions.length * product.dimensions.width * product.dimensions.height
-        size_factor = volume / 10000  # Normalize
-        
-        # Fragile factor
-        fragile_factor = 5 if is_fragile else 0
-        
-        # Distance factor (simplified)
-        distance_factor = 10  # Would normally be calculated based on origin/destination
-        
-        # Calculate prices
-        standard_price = base_standard + weight_factor + size_factor + fragile_factor
-        express_price = base_express + weight_factor * 1.5 + size_factor * 1.2 + fragile_factor * 1.5
-        priority_price = base_priority + weight_factor * 2 + size_factor * 1.5 + fragile_factor * 2
-        
-        # Generate shipping recommendations
-        recommendations = f"""# Shipping Recommendations
-
-Based on your package details:
-- Contents: {product.name}
-- Dimensions: {product.dimensions.length} × {product.dimensions.width} × {product.dimensions.height} {product.dimensions.unit}
-- Weight: {product.weight.value} {product.weight.unit}
-- Fragile: {"Yes" if is_fragile else "No"}
-- Destination: {destination.city}, {destination.country}
+# Issued quotes are logged here for the analytics export (analytics_export.py)
+QUOTES_DIR = "/quotes"
+quotes_volume = modal.Volume.from_name("shipping-quotes", create_if_missing=True)
 
-## Option 1: Standard Delivery
-- **Price**: €{standard_price:.2f}
-- **Delivery Time**: 3-5 business days
-- **Special Handling**: {"Fragile package protection included" if is_fragile else "Standard packaging"}
+# Logged quotes are published to the volume in the background at most this
+# often, and on shutdown; a commit is a network round trip, never paid per request
+QUOTE_COMMIT_INTERVAL = float(os.environ.get("QUOTE_COMMIT_INTERVAL", 30))
+quote_commits = PeriodicCommit(quotes_volume, QUOTE_COMMIT_INTERVAL)
+# The plain web endpoints have no shutdown hook of their own
+atexit.register(quote_commits.flush)
 
-## Option 2: Express Delivery
-- **Price**: €{express_price:.2f}
-- **Delivery Time**: 2-3 business days
-- **Special Handling**: {"Extra padding and fragile labeling" if is_fragile else "Expedited processing"}
+def record_quotes(requests):
+    """Append issued quotes to the analytics log; never fails the request."""
+    try:
+        issued_at = datetime.now()
+        log_quotes([quote_record(r, issued_at) for r in requests], QUOTES_DIR)
+        quote_commits.mark()
+    except Exception as e:
+        print(f"Error logging quotes: {str(e)}")
 
-## Option 3: Priority Shipping
-- **Price**: €{priority_price:.2f}
-- **Delivery Time**: 1-2 business days
-- **Special Handling**: {"Premium protection with signature required" if is_fragile else "Premium handling with tracking"}
+@web_app.on_event("shutdown")
+async def flush_quotes():
+    """Publish quotes logged since the last background commit"""
+    await asyncio.to_thread(quote_commits.flush)
 
-All options include tracking and insurance up to €100. Estimated delivery within {delivery_days} days to {destination.city}."""
+async def build_recommendation(shipping_request: ShippingRequest) -> ShippingRecommendation:
+    """Price the request and wrap it in a ShippingRecommendation."""
+    try:
+        # Record start time for processing time calculation
+        start_time = time.time()
+        
+        # Price the package and render the Markdown quote
+        recommendations = quote_from_request(shipping_request)
+        # A small local append; the volume commit happens in the background
+        record_quotes([shipping_request])
 
         # Calculate processing time
         processing_time = time.time() - start_time
@@ -226,22 +167,76 @@ All options include tracking and insurance up to €100. Estimated delivery with
             }
         )
 
+@web_app.post("/api/shipping/recommend/batch")
+def web_app_shipping_recommend_batch(batch: BatchShippingRequest):
+    """Quote many packages at once, sharded across the container's cores."""
+    # Sync handler on purpose: FastAPI runs it in a threadpool, so a large
+    # batch doesn't block the event loop while the process pool works
+    try:
+        start_time = time.time()
+        workers = min(batch.workers or QUOTE_WORKERS, QUOTE_WORKERS)
+        # Sharded batches are logged by the pool workers, not item by item here
+        texts = quote_batch(batch.requests, workers=workers, quotes_dir=QUOTES_DIR)
+        quote_commits.mark()
+
+        return BatchShippingRecommendation(
+            texts=texts,
+            modelUsed="Modal Shipping Calculator",
+            workers=workers,
+            processingTime=time.time() - start_time
+        )
+
+    except Exception as e:
+        print(f"Error generating batch recommendation: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": "Error generating batch recommendation",
+                "error": str(e)
+            }
+        )
+
+# Add the endpoint to FastAPI app as well, for better debugging
+@web_app.post("/api/shipping/recommend")
+async def web_app_shipping_recommend(shipping_request: ShippingRequest):
+    """FastAPI endpoint for shipping recommendations."""
+    # Every POST is an issued (and logged) quote, never served from a cache
+    recommendation = await build_recommendation(shipping_request)
+    return JSONResponse(content=recommendation.model_dump(), headers={"Cache-Control": "no-store"})
+
 # Set up the Modal web endpoint - explicit route for better discoverability
-@app.function(image=image)
+@app.function(image=image, volumes={QUOTES_DIR: quotes_volume})
 @modal.web_endpoint(method="POST")
 async def api_shipping_recommend(shipping_request: ShippingRequest):
     """Generate shipping recommendations based on package details."""
     # Reuse the same logic from the FastAPI endpoint
-    return await web_app_shipping_recommend(shipping_request)
+    return await build_recommendation(shipping_request)
+
+_health_cache = {"expires": 0.0, "body": None}
+
+def health_response() -> JSONResponse:
+    """Health payload, rebuilt at most every HEALTH_TTL seconds and cacheable for that long."""
+    now = time.time()
+    if now >= _health_cache["expires"]:
+        _health_cache["body"] = {"status": "healthy", "timestamp": now}
+        _health_cache["expires"] = now + HEALTH_TTL
+    max_age = max(0, int(_health_cache["expires"] - now))
+    return JSONResponse(content=_health_cache["body"], headers={"Cache-Control": f"public, max-age={max_age}"})
 
 # Add a simple health check endpoint
 @app.function(image=image)
 @modal.web_endpoint(method="GET")
 async def health():
-    return {"status": "healthy", "timestamp": time.time()}
+    return health_response()
+
+@web_app.get("/health")
+async def web_app_health():
+    return health_response()
 
 # Serve the entire FastAPI app - this is necessary for the web_app endpoints to be accessible
-@app.function(image=image)
+# Give the container enough cores for the batch quote process pool
+@app.function(image=image, cpu=QUOTE_WORKERS, volumes={QUOTES_DIR: quotes_volume},
+              secrets=profile_secrets())
 @modal.asgi_app()
 def fastapi_app():
     return web_app
@@ -0,0 +1,269 @@
+# profiling.py - on-demand sampling profiler and allocation snapshots for the ASGI apps
+#
+# Opt-in: nothing is installed unless PROFILE_TOKEN is set. The ASGI apps only
+# attach a Modal secret for it when PROFILE_SECRET names one at deploy time
+# (see profile_secrets and the README), so a plain `modal deploy` needs no secret:
+#   modal secret create profile-token PROFILE_TOKEN=<token>
+#   PROFILE_SECRET=profile-token modal deploy Modal_ai.py
+# With it set:
+#   - a request sent with `X-Profile: <token>` is profiled while it runs
+#     (add `X-Profile-Alloc: 1` for tracemalloc); the response carries
+#     X-Profile-Id
+#   - POST /admin/profile?seconds=N profiles the whole process for N seconds
+#   - GET /admin/profiles/{id}?format=collapsed|speedscope|alloc fetches a result
+# Admin routes need the same X-Profile header.
+#
+# The sampler is a background thread reading sys._current_frames() every
+# PROFILE_INTERVAL seconds, so the handlers run unmodified. The event loop is
+# shared, so a per-request profile also contains whatever else the loop ran
+# meanwhile. Results are kept in memory, newest PROFILE_KEEP only.
+
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+# Name of the Modal secret holding PROFILE_TOKEN, read where `modal deploy` runs
+PROFILE_SECRET = os.environ.get("PROFILE_SECRET", "")
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 0.005))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", 60))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 20))
+# Concurrent profiles (each has its own sampler thread)
+MAX_ACTIVE = 2
+# Allocation sites reported per snapshot diff
+ALLOC_TOP = 25
+
+# Profiles currently using tracemalloc
+_tracing = 0
+
+# Leaf frames of threads that are just waiting; they'd swamp every profile
+IDLE_FRAMES = {
+    ("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"),
+    ("threading.py", "_wait_for_tstate_lock"),
+}
+
+
+class Profile:
+    """One finished profile: sampled stacks plus optional allocation diff."""
+
+    def __init__(self, name, interval):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.interval = interval
+        self.started = time.time()
+        self.duration = 0.0
+        self.stacks = Counter()  # tuple of (function, file, line) root-first -> samples
+        self.allocations = None
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed format, one `frame;frame;frame count` per line."""
+        return "\n".join(
+            ";".join(f"{name} ({os.path.basename(file)}:{line})" for name, file, line in stack) + f" {count}"
+            for stack, count in self.stacks.most_common()
+        ) + "\n"
+
+    def speedscope(self) -> dict:
+        frames, index = [], {}
+        samples, weights = [], []
+        for stack, count in self.stacks.items():
+            sample = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    name, file, line = frame
+                    frames.append({"name": name, "file": file, "line": line})
+                sample.append(index[frame])
+            samples.append(sample)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "profiling.py",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration,
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def summary(self) -> dict:
+        return {"id": self.id, "name": self.name, "started": self.started, "duration": self.duration,
+                "samples": sum(self.stacks.values()), "allocations": self.allocations is not None}
+
+
+class Sampler:
+    """Samples every thread's Python stack on a background thread until stopped."""
+
+    def __init__(self, name, interval: float = PROFILE_INTERVAL, allocations: bool = False):
+        self.profile = Profile(name, interval)
+        self.allocations = allocations
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._snapshot = None
+
+    def start(self):
+        global _tracing
+        if self.allocations:
+            if _tracing == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+            _tracing += 1
+            self._snapshot = tracemalloc.take_snapshot()
+        self._begin = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> Profile:
+        global _tracing
+        self._stop.set()
+        self._thread.join()
+        profile = self.profile
+        profile.duration = time.perf_counter() - self._begin
+        if self.allocations:
+            # Leave out the profiler's own bookkeeping
+            own = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+            diff = tracemalloc.take_snapshot().filter_traces(own).compare_to(self._snapshot.filter_traces(own), "lineno")
+            profile.allocations = [str(stat) for stat in diff[:ALLOC_TOP]]
+            # Tracing slows every allocation; stop once the last profile using it is done
+            _tracing -= 1
+            if _tracing == 0:
+                tracemalloc.stop()
+        return profile
+
+    def _run(self):
+        me = threading.get_ident()
+        stacks = self.profile.stacks
+        # Long-lived requests (SSE) stop being sampled after PROFILE_MAX_SECONDS
+        deadline = time.perf_counter() + PROFILE_MAX_SECONDS
+        while not self._stop.wait(self.profile.interval) and time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append((frame.f_code.co_name, frame.f_code.co_filename, frame.f_lineno))
+                    frame = frame.f_back
+                stack.reverse()
+                stacks[tuple(stack)] += 1
+
+
+# Finished profiles, newest last
+profiles = OrderedDict()
+_active = 0
+
+
+def _keep(profile: Profile):
+    profiles[profile.id] = profile
+    while len(profiles) > PROFILE_KEEP:
+        profiles.popitem(last=False)
+
+
+def authorized(token) -> bool:
+    if not PROFILE_TOKEN or token is None:
+        return False
+    # Constant-time, so response timing doesn't leak the token prefix
+    return hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: profile requests that carry a valid X-Profile header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _active
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers", []))
+        token = headers.get(b"x-profile")
+        if token is None or not authorized(token.decode("latin-1")) or _active >= MAX_ACTIVE:
+            return await self.app(scope, receive, send)
+
+        _active += 1
+        sampler = Sampler(f"{scope['method']} {scope['path']}",
+                          allocations=headers.get(b"x-profile-alloc") == b"1").start()
+        profile_id = sampler.profile.id.encode()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile_id)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _keep(sampler.stop())
+            _active -= 1
+
+
+def profile_secrets():
+    """Secrets for the ASGI app functions: the PROFILE_SECRET secret if one was
+    named at deploy time, else none, so deploying never depends on it existing."""
+    if not PROFILE_SECRET:
+        return []
+    import modal
+    return [modal.Secret.from_name(PROFILE_SECRET)]
+
+
+def add_profiling(web_app):
+    """Install the middleware and admin routes on a FastAPI app if PROFILE_TOKEN is set."""
+    if not PROFILE_TOKEN:
+        return
+
+    web_app.add_middleware(ProfilingMiddleware)
+
+    def check(request: Request):
+        if not authorized(request.headers.get("x-profile")):
+            raise HTTPException(status_code=403, detail="Profiling not authorized")
+
+    @web_app.post("/admin/profile")
+    async def profile_window(request: Request, seconds: float = 10, alloc: bool = False):
+        """Profile the whole process for `seconds`, then return the profile summary"""
+        global _active
+        check(request)
+        if _active >= MAX_ACTIVE:
+            raise HTTPException(status_code=409, detail="Another profile is running")
+        _active += 1
+        try:
+            sampler = Sampler(f"window {seconds:g}s", allocations=alloc).start()
+            await asyncio.sleep(min(seconds, PROFILE_MAX_SECONDS))
+            profile = sampler.stop()
+        finally:
+            _active -= 1
+        _keep(profile)
+        return profile.summary()
+
+    @web_app.get("/admin/profiles")
+    async def list_profiles(request: Request):
+        check(request)
+        return [profile.summary() for profile in reversed(profiles.values())]
+
+    @web_app.get("/admin/profiles/{profile_id}")
+    async def get_profile(request: Request, profile_id: str, format: str = "speedscope"):
+        """A stored profile as speedscope JSON, collapsed stacks or allocation diff"""
+        check(request)
+        profile = profiles.get(profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Unknown profile")
+        if format == "collapsed":
+            return PlainTextResponse(profile.collapsed())
+        if format == "alloc":
+            return {"id": profile.id, "allocations": profile.allocations}
+        return JSONResponse(profile.speedscope())
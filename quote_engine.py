@@ -0,0 +1,385 @@
+# quote_engine.py - pricing + Markdown rendering for shipping quotes
+#
+# Pure python (no modal / fastapi imports) so it can run inside pool workers.
+# Large batches are sharded across a process pool: inputs are packed once into
+# shared memory and each worker sends back one joined string per shard, so
+# nothing gets pickled per item. Text is length-prefixed (offset tables), never
+# split on separators, so any character in user input is safe.
+
+import json
+import os
+import threading
+import uuid
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+# Number of worker processes for batch quotes (also the CPU count reserved for
+# the container, see modal_shipping_api.py)
+QUOTE_WORKERS = int(os.environ.get("QUOTE_WORKERS", 8))
+
+# Below this many items the pool overhead isn't worth it
+PARALLEL_MIN_BATCH = int(os.environ.get("QUOTE_PARALLEL_MIN_BATCH", 256))
+
+# Numeric fields per item: weight, length, width, height
+NUM_FIELDS = 4
+# Text fields per item: name, type, dimension unit, weight unit, origin city,
+# origin country, city, country, transport mode, pickup, deadline, special requirements
+TEXT_FIELDS = 12
+
+
+# Helper function to parse natural language dates
+def parse_date(date_string: str, today: datetime = None) -> str:
+    """
+    Converts natural language date strings to YYYY-MM-DD format.
+    Falls back to current date + offset if parsing fails.
+    Relative phrases are resolved against today (defaults to now).
+    """
+    # If it's already in YYYY-MM-DD format, return it
+    try:
+        datetime.strptime(date_string, "%Y-%m-%d")
+        return date_string
+    except ValueError:
+        pass
+
+    # Handle common natural language date phrases
+    today = today or datetime.now()
+    date_string = date_string.lower()
+
+    if "today" in date_string:
+        return today.strftime("%Y-%m-%d")
+    elif "tomorrow" in date_string:
+        return (today + timedelta(days=1)).strftime("%Y-%m-%d")
+    elif "next day" in date_string:
+        return (today + timedelta(days=1)).strftime("%Y-%m-%d")
+    elif "weekend" in date_string:
+        # Find the next Saturday
+        days_until_saturday = (5 - today.weekday()) % 7
+        if days_until_saturday == 0:
+            days_until_saturday = 7
+        return (today + timedelta(days=days_until_saturday)).strftime("%Y-%m-%d")
+    elif "week" in date_string:
+        return (today + timedelta(days=7)).strftime("%Y-%m-%d")
+    elif "month" in date_string:
+        return (today + timedelta(days=30)).strftime("%Y-%m-%d")
+    elif "april" in date_string or "apr" in date_string:
+        april = datetime(today.year, 4, 15)
+        if today > april:
+            april = datetime(today.year + 1, 4, 15)
+        return april.strftime("%Y-%m-%d")
+    elif "may" in date_string:
+        may = datetime(today.year, 5, 15)
+        if today > may:
+            may = datetime(today.year + 1, 5, 15)
+        return may.strftime("%Y-%m-%d")
+    elif "june" in date_string or "jun" in date_string:
+        june = datetime(today.year, 6, 15)
+        if today > june:
+            june = datetime(today.year + 1, 6, 15)
+        return june.strftime("%Y-%m-%d")
+    else:
+        # Default to a week from now for any other phrase
+        return (today + timedelta(days=7)).strftime("%Y-%m-%d")
+
+
+def delivery_days_between(pickup: str, deadline: str, today: datetime = None) -> int:
+    """Days between pickup and delivery, handling natural language dates."""
+    pickup_date = datetime.strptime(parse_date(pickup, today), "%Y-%m-%d")
+    delivery_date = datetime.strptime(parse_date(deadline, today), "%Y-%m-%d")
+    return (delivery_date - pickup_date).days
+
+
+def calculate_prices(weight: float, length: float, width: float, height: float, is_fragile: bool):
+    """Return (standard, express, priority) prices."""
+    # Calculate shipping prices based on weight and dimensions
+    base_standard = 15
+    base_express = 25
+    base_priority = 35
+
+    # Weight factor
+    weight_factor = weight * 2
+
+    # Size factor (approximation of volume)
+    volume = length * width * height
+    size_factor = volume / 10000  # Normalize
+
+    # Fragile factor
+    fragile_factor = 5 if is_fragile else 0
+
+    # Calculate prices
+    standard_price = base_standard + weight_factor + size_factor + fragile_factor
+    express_price = base_express + weight_factor * 1.5 + size_factor * 1.2 + fragile_factor * 1.5
+    priority_price = base_priority + weight_factor * 2 + size_factor * 1.5 + fragile_factor * 2
+    return standard_price, express_price, priority_price
+
+
+def render_quote(name, length, width, height, dim_unit, weight, weight_unit,
+                 is_fragile, city, country, delivery_days, prices) -> str:
+    """Render the Markdown recommendation text."""
+    standard_price, express_price, priority_price = prices
+    return f"""# Shipping Recommendations
+
+Based on your package details:
+- Contents: {name}
+- Dimensions: {length} × {width} × {height} {dim_unit}
+- Weight: {weight} {weight_unit}
+- Fragile: {"Yes" if is_fragile else "No"}
+- Destination: {city}, {country}
+
+## Option 1: Standard Delivery
+- **Price**: €{standard_price:.2f}
+- **Delivery Time**: 3-5 business days
+- **Special Handling**: {"Fragile package protection included" if is_fragile else "Standard packaging"}
+
+## Option 2: Express Delivery
+- **Price**: €{express_price:.2f}
+- **Delivery Time**: 2-3 business days
+- **Special Handling**: {"Extra padding and fragile labeling" if is_fragile else "Expedited processing"}
+
+## Option 3: Priority Shipping
+- **Price**: €{priority_price:.2f}
+- **Delivery Time**: 1-2 business days
+- **Special Handling**: {"Premium protection with signature required" if is_fragile else "Premium handling with tracking"}
+
+All options include tracking and insurance up to €100. Estimated delivery within {delivery_days} days to {city}."""
+
+
+def quote_from_request(shipping_request) -> str:
+    """Price and render a single ShippingRequest."""
+    product = shipping_request.product
+    destination = shipping_request.destination
+    is_fragile = "fragile" in shipping_request.special_requirements.lower()
+    delivery_days = delivery_days_between(
+        shipping_request.timeline.pickup_date,
+        shipping_request.timeline.delivery_deadline
+    )
+    dims = product.dimensions
+    prices = calculate_prices(product.weight.value, dims.length, dims.width, dims.height, is_fragile)
+    return render_quote(
+        product.name, dims.length, dims.width, dims.height, dims.unit,
+        product.weight.value, product.weight.unit, is_fragile,
+        destination.city, destination.country, delivery_days, prices
+    )
+
+
+# Quote log file owned by this process. Containers share the volume and a
+# volume file is last-writer-wins, so each container (and each batch worker
+# process) appends only to its own file.
+QUOTE_LOG_WRITER = f"{os.environ.get('MODAL_TASK_ID', 'local')}-{uuid.uuid4().hex[:8]}"
+_log_lock = threading.Lock()
+
+# Log timestamp format (issued_at)
+ISSUED_AT_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def _record(issued_at: str, name, product_type, weight, weight_unit, length, width, height, dim_unit,
+            is_fragile, origin_city, origin_country, city, country, transport_mode, pickup, deadline) -> dict:
+    standard, express, priority = calculate_prices(weight, length, width, height, is_fragile)
+    return {
+        "issued_at": issued_at,
+        "product_name": name,
+        "product_type": product_type,
+        "weight": weight,
+        "weight_unit": weight_unit,
+        "length": length,
+        "width": width,
+        "height": height,
+        "dimension_unit": dim_unit,
+        "fragile": is_fragile,
+        "origin_city": origin_city,
+        "origin_country": origin_country,
+        "destination_city": city,
+        "destination_country": country,
+        "transport_mode": transport_mode,
+        "pickup_date": pickup,
+        "delivery_deadline": deadline,
+        "standard_price": standard,
+        "express_price": express,
+        "priority_price": priority,
+    }
+
+
+def quote_record(shipping_request, issued_at: datetime) -> dict:
+    """Flat record of a quote for the analytics log, including the prices actually quoted."""
+    product = shipping_request.product
+    dims = product.dimensions
+    return _record(
+        issued_at.strftime(ISSUED_AT_FORMAT), product.name, product.type,
+        product.weight.value, product.weight.unit, dims.length, dims.width, dims.height, dims.unit,
+        "fragile" in shipping_request.special_requirements.lower(),
+        shipping_request.origin.city, shipping_request.origin.country,
+        shipping_request.destination.city, shipping_request.destination.country,
+        shipping_request.transport_mode,
+        shipping_request.timeline.pickup_date, shipping_request.timeline.delivery_deadline
+    )
+
+
+def log_quotes(records, quotes_dir: str = "/quotes"):
+    """Append quote records to <day>/<writer>.jsonl, read later by analytics_export.py.
+
+    Each file has exactly one appender (this process), so it only ever grows.
+    """
+    if not records:
+        return
+    day = records[0]["issued_at"][:10]
+    os.makedirs(f"{quotes_dir}/{day}", exist_ok=True)
+    with _log_lock, open(f"{quotes_dir}/{day}/{QUOTE_LOG_WRITER}.jsonl", "a") as f:
+        f.write("".join(json.dumps(r) + "\n" for r in records))
+
+
+def _log_quietly(records, quotes_dir):
+    """log_quotes for the quote paths: a logging failure never fails the quote."""
+    try:
+        log_quotes(records, quotes_dir)
+    except Exception as e:
+        print(f"Error logging quotes: {str(e)}")
+
+
+def _pack_batch(requests):
+    """Pack a batch into (numeric bytes, text bytes, text lengths bytes).
+
+    All text fields are joined into one string and encoded once as UTF-32, so
+    character offsets are byte offsets / 4. Every text field has its own entry
+    in the lengths table, TEXT_FIELDS per item in the order _quote_shard reads.
+    """
+    numbers = []
+    texts = []
+    for r in requests:
+        product = r.product
+        dims = product.dimensions
+        weight = product.weight
+        origin = r.origin
+        destination = r.destination
+        timeline = r.timeline
+        numbers += (weight.value, dims.length, dims.width, dims.height)
+        texts += (
+            product.name, product.type, dims.unit, weight.unit,
+            origin.city, origin.country, destination.city, destination.country,
+            r.transport_mode, timeline.pickup_date, timeline.delivery_deadline, r.special_requirements
+        )
+    return (
+        array("d", numbers).tobytes(),
+        "".join(texts).encode("utf-32-le"),
+        array("q", map(len, texts)).tobytes(),
+    )
+
+
+def _unpack_quotes(lengths: bytes, body: str):
+    """Split a worker's joined quotes back into a list using its length table."""
+    ends = list(accumulate(array("q", lengths)))
+    return [body[start:end] for start, end in zip([0] + ends, ends)]
+
+
+def _quote_shard(shm_name: str, count: int, num_size: int, text_size: int, lo: int, hi: int,
+                 quotes_dir: str = None, issued_at: str = None):
+    """Worker: quote (and log, if quotes_dir is set) items [lo, hi) straight
+    out of the shared input buffer.
+
+    Returns (packed quote lengths, all quotes joined into one string). A single
+    str pickles and unpickles as one UTF-8 copy, which keeps the parent's
+    per-item work down to one slice.
+    """
+    shm = SharedMemory(name=shm_name)
+    try:
+        # The views must be released before close(), even when quoting fails,
+        # otherwise close() raises BufferError and hides the real error
+        with shm.buf[:num_size] as raw_numbers, \
+                shm.buf[num_size:num_size + text_size] as text, \
+                shm.buf[num_size + text_size:num_size + text_size + count * TEXT_FIELDS * 8] as raw_lengths, \
+                raw_numbers.cast("d") as numbers, raw_lengths.cast("q") as lengths:
+            # Field bounds for this shard only, relative to its decoded text
+            first = sum(lengths[:lo * TEXT_FIELDS])
+            bounds = list(accumulate(lengths[lo * TEXT_FIELDS:hi * TEXT_FIELDS], initial=0))
+            shard_text = bytes(text[first * 4:(first + bounds[-1]) * 4]).decode("utf-32-le")
+            values = numbers[lo * NUM_FIELDS:hi * NUM_FIELDS].tolist()
+
+        out = []
+        records = []
+        for n in range(hi - lo):
+            weight, length, width, height = values[n * NUM_FIELDS:(n + 1) * NUM_FIELDS]
+            base = n * TEXT_FIELDS
+            (name, product_type, dim_unit, weight_unit, origin_city, origin_country,
+             city, country, transport_mode, pickup, deadline, special) = (
+                shard_text[bounds[base + j]:bounds[base + j + 1]] for j in range(TEXT_FIELDS)
+            )
+            is_fragile = "fragile" in special.lower()
+            prices = calculate_prices(weight, length, width, height, is_fragile)
+            out.append(render_quote(
+                name, length, width, height, dim_unit, weight, weight_unit,
+                is_fragile, city, country, delivery_days_between(pickup, deadline), prices
+            ))
+            if quotes_dir is not None:
+                records.append(_record(
+                    issued_at, name, product_type, weight, weight_unit, length, width, height, dim_unit,
+                    is_fragile, origin_city, origin_country, city, country, transport_mode, pickup, deadline
+                ))
+
+        if records:
+            _log_quietly(records, quotes_dir)
+        return array("q", map(len, out)).tobytes(), "".join(out)
+    finally:
+        shm.close()
+
+
+def quote_batch(requests, workers: int = None, quotes_dir: str = None):
+    """Quote a list of ShippingRequests, sharding across processes when large.
+
+    workers only sets the number of shards; it is clamped to 1..QUOTE_WORKERS
+    and every batch shares the one process pool. With quotes_dir set, every
+    quote is also logged (see log_quotes); sharded batches are logged by the
+    workers, into their own files, so the parent does no per-item log work.
+    """
+    workers = max(1, min(workers or QUOTE_WORKERS, QUOTE_WORKERS))
+    issued_at = datetime.now()
+    if workers <= 1 or len(requests) < PARALLEL_MIN_BATCH:
+        if quotes_dir is not None:
+            _log_quietly([quote_record(r, issued_at) for r in requests], quotes_dir)
+        return [quote_from_request(r) for r in requests]
+
+    num_bytes, text_bytes, length_bytes = _pack_batch(requests)
+    shm = SharedMemory(create=True, size=len(num_bytes) + len(text_bytes) + len(length_bytes))
+    try:
+        text_start = len(num_bytes)
+        lengths_start = text_start + len(text_bytes)
+        shm.buf[:text_start] = num_bytes
+        shm.buf[text_start:lengths_start] = text_bytes
+        shm.buf[lengths_start:lengths_start + len(length_bytes)] = length_bytes
+
+        # One contiguous shard per worker
+        count = len(requests)
+        step = -(-count // workers)
+        shards = [(lo, min(lo + step, count)) for lo in range(0, count, step)]
+
+        pool = _get_pool()
+        futures = [
+            pool.submit(_quote_shard, shm.name, count, len(num_bytes), len(text_bytes), lo, hi,
+                        quotes_dir, issued_at.strftime(ISSUED_AT_FORMAT))
+            for lo, hi in shards
+        ]
+        results = []
+        for f in futures:
+            results.extend(_unpack_quotes(*f.result()))
+        assert len(results) == len(requests), f"{len(results)} quotes for {len(requests)} requests"
+        return results
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """One QUOTE_WORKERS-sized process pool for the life of the container.
+
+    Batch requests run in the threadpool, so creation is locked.
+    """
+    global _pool
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=QUOTE_WORKERS, mp_context=get_context("spawn"))
+    return _pool
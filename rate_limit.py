@@ -0,0 +1,159 @@
+# rate_limit.py - admission control in front of the LLM-backed interview turns
+#
+# Two layers:
+# - TokenBucket: per client (IP / session) requests-per-second limit
+# - AdmissionGate: global cap on concurrent LLM calls with a bounded wait queue
+# Anything shed gets a 429 with Retry-After straight away instead of piling up.
+
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi.responses import JSONResponse
+
+# Per-client bucket: sustained rate and burst size
+RATE_PER_SECOND = float(os.environ.get("INTERVIEW_RATE_PER_SECOND", 0.5))
+RATE_BURST = int(os.environ.get("INTERVIEW_RATE_BURST", 3))
+# Global gate: concurrent LLM calls, how many may wait, and for how long
+MAX_CONCURRENT = int(os.environ.get("INTERVIEW_MAX_CONCURRENT", 8))
+MAX_QUEUE = int(os.environ.get("INTERVIEW_MAX_QUEUE", 16))
+QUEUE_TIMEOUT = float(os.environ.get("INTERVIEW_QUEUE_TIMEOUT", 5.0))
+
+
+class Rejected(Exception):
+    """Raised when a request is shed; carries the Retry-After hint in seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket per key. Idle buckets are dropped so memory stays bounded."""
+
+    def __init__(self, rate: float = RATE_PER_SECOND, burst: int = RATE_BURST, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = {}  # key -> [tokens, last_refill]
+        self.rejected = 0
+
+    def acquire(self, key: str):
+        """Take one token for key, or raise Rejected with the time until the next one."""
+        now = time.monotonic()
+        tokens, last = self.buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+        if tokens < 1:
+            self.buckets[key] = [tokens, now]
+            self.rejected += 1
+            raise Rejected("rate_limited", (1 - tokens) / self.rate)
+
+        self.buckets[key] = [tokens - 1, now]
+        if len(self.buckets) > self.max_keys:
+            self._evict(now)
+
+    def _evict(self, now: float):
+        # A bucket idle long enough to be full again is the same as no bucket
+        full_after = self.burst / self.rate
+        self.buckets = {k: v for k, v in self.buckets.items() if now - v[1] < full_after}
+
+
+class AdmissionGate:
+    """Global concurrency limit with a bounded, time-limited wait queue."""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT, max_queue: int = MAX_QUEUE,
+                 queue_timeout: float = QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        # Rolling average of how long a slot is held, used for Retry-After
+        self.avg_hold = 1.0
+
+    @asynccontextmanager
+    async def admit(self):
+        # Counted synchronously (the semaphore itself is only taken after an await)
+        if self.in_flight + self.queued >= self.max_concurrent + self.max_queue:
+            self.rejected_queue_full += 1
+            raise Rejected("queue_full", self._retry_after())
+
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            raise Rejected("queue_timeout", self._retry_after())
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        self.admitted += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.avg_hold = 0.9 * self.avg_hold + 0.1 * (time.monotonic() - start)
+            self.semaphore.release()
+
+    def _retry_after(self) -> float:
+        # Roughly the time for everyone ahead of us to get through
+        return self.avg_hold * (self.queued + 1) / self.max_concurrent
+
+
+class InterviewLimiter:
+    """Per-client bucket + global gate, plus the numbers for /metrics."""
+
+    def __init__(self):
+        self.bucket = TokenBucket()
+        self.gate = AdmissionGate()
+
+    @asynccontextmanager
+    async def limit(self, key: str):
+        self.bucket.acquire(key)
+        async with self.gate.admit():
+            yield
+
+    def metrics(self):
+        return {
+            "in_flight": self.gate.in_flight,
+            "queue_depth": self.gate.queued,
+            "max_concurrent": self.gate.max_concurrent,
+            "max_queue": self.gate.max_queue,
+            "admitted": self.gate.admitted,
+            "rejected_rate_limited": self.bucket.rejected,
+            "rejected_queue_full": self.gate.rejected_queue_full,
+            "rejected_queue_timeout": self.gate.rejected_timeout,
+            "tracked_clients": len(self.bucket.buckets),
+        }
+
+
+def client_key(request, session_id: str = None) -> str:
+    """Session id if the caller has one, otherwise the client IP."""
+    if session_id:
+        return f"session:{session_id}"
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        # Only the right-most entry is added by our proxy; anything to its
+        # left is whatever the client sent and can't be trusted
+        return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def too_many_requests(rejected: Rejected) -> JSONResponse:
+    """Fast 429 with Retry-After for a shed request."""
+    retry_after = max(1, math.ceil(rejected.retry_after))
+    return JSONResponse(
+        status_code=429,
+        content={"error": "Too many requests, please try again shortly.", "reason": rejected.reason},
+        headers={"Retry-After": str(retry_after)},
+    )
@@ -7,6 +7,7 @@ from typing import Optional, Dict, Any
 from pydantic import BaseModel, Field
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import modal
 
 # Define the FastAPI app
@@ -175,11 +176,20 @@ All options include tracking and insurance up to €100. Estimated delivery with
             }
         )
 
+# Health payload is rebuilt at most every HEALTH_TTL seconds and cacheable for that long
+HEALTH_TTL = 5
+_health_cache = {"expires": 0.0, "body": None}
+
 # Add a simple health check endpoint
 @app.function(image=image)
 @modal.web_endpoint(method="GET")
 async def health():
-    return {"status": "healthy", "timestamp": time.time()}
+    now = time.time()
+    if now >= _health_cache["expires"]:
+        _health_cache["body"] = {"status": "healthy", "timestamp": now}
+        _health_cache["expires"] = now + HEALTH_TTL
+    max_age = max(0, int(_health_cache["expires"] - now))
+    return JSONResponse(content=_health_cache["body"], headers={"Cache-Control": f"public, max-age={max_age}"})
 
 # Serve the entire FastAPI app
 @app.function(image=image)